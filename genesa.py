@@ -1,12 +1,17 @@
+import array
+import collections
 import datetime as dt
 import json
 import os
 import queue
+import selectors
 import signal # signal.SIGTERM
 import socket
+import struct
 import sys
 import threading as thr
 import time
+import zlib
 
 import keyboard as kbd
 
@@ -44,8 +49,18 @@ class Config:
 	EVENT_KEYPRESS      = 'press'
 	EVENT_KEYRELEASE    = 'release'
 	EVENT_DISCONNECT    = 'dc'
+	EVENT_KEY_TABLE     = 'keys'
 
-	NB_LOOP_DELAY = 0.001#s
+	QUEUE_CLOSED = None # passed to g_emit by trigger_exit(); consumer stops
+
+	BATCH_WINDOW = 0.0#s  client waits this long for more events to share a packet
+	REDUNDANT_EVENTS = 4 # last sent events repeated in every client packet
+	SNAPSHOT_INTERVAL = 0.5#s  idle client resends held keys this often
+	PEER_TIMEOUT = 5.0#s  host releases keys of clients silent for this long
+
+	GRAB_DEVICES = False # client grabs the keyboards it listens to (linux only); NO key on them reaches other programs while running
+	ASYNC = False # run everything on a single asyncio loop instead of threads (or pass --async)
+	HOST_SHARDS = 0 # host decodes packets in this many worker processes, 0 = in the host process (or pass --shards=N)
 
 
 def log_event(*args, level=Config.LOG_INFO, **kwargs):
@@ -58,22 +73,337 @@ def log_event(*args, level=Config.LOG_INFO, **kwargs):
 	}.get(level, 'LOG')
 
 	if level >= Config.LOG_LEVEL:
-		sys.stderr.write(f'[{lvl_txt}] {str(dt.datetime.now()).replace(" ","_")}: ')
-		sys.stderr.write(', '.join(map(str, args)))
-		sys.stderr.write(f'\n')
+		# single write, so lines from other threads/shard processes don't interleave
+		sys.stderr.write(f'[{lvl_txt}] {str(dt.datetime.now()).replace(" ","_")}: {", ".join(map(str, args))}\n')
+
+
+class Proto:
+	""" Binary wire protocol shared by host and client
+
+		Every datagram starts with HEADER (magic, version, packet type)
+		followed by a type-specific payload:
+			- PKT_EVENTS:     COUNT followed by that many EVENT records, oldest
+			                  first; the first `resent` ones repeat events
+			                  from earlier packets so single losses recover.
+			                  If COUNT has snapshot bytes, SNAPSHOT and a
+			                  bitmap of held key ids (bit i of byte i//8)
+			                  follow; count may be 0 for snapshot only packets.
+			                  Key ids refer to the key table with COUNT's
+			                  table id (see key_table_id)
+			- PKT_KEY_TABLE:  client key names, '\\0' separated, indexed by key id
+			- PKT_DISCONNECT: empty
+	"""
+	MAGIC   = b'GN'
+	VERSION = 5
+
+	PKT_EVENTS      = 1
+	PKT_KEY_TABLE   = 2
+	PKT_DISCONNECT  = 3
+
+	EV_PRESS    = 1
+	EV_RELEASE  = 2
+
+	# magic, version, packet type
+	HEADER = struct.Struct('!2sBB')
+	# number of EVENT records in a PKT_EVENTS packet, how many of them are resent,
+	# size of the held keys bitmap (0 = no snapshot), id of the key table in use
+	COUNT  = struct.Struct('!BBBI')
+	# sequence number, timestamp (ms, wraps), event type, key id
+	EVENT  = struct.Struct('!IIBH')
+	# snapshot is the held keys state after this event sequence number
+	SNAPSHOT = struct.Struct('!I')
+	MAX_SNAPSHOT_KEYS = 255 * 8
+
+	MAX_PACKET  = 2048
+	MAX_EVENTS  = 128 # per packet; fits MAX_PACKET and COUNT
+	KEY_SEP     = b'\0'
+
+
+def new_event(typ, name, time_s=None):
+	""" Item passed to g_emit on the client; encoded by ClientSender.send """
+	if time_s is None:
+		time_s = time.time()
+	return typ, name, time_s
+
+
+class PacketEncoder:
+	def __init__(self):
+		""" Packs into a single preallocated buffer; returned views are
+			only valid until the next call """
+		self.buf = bytearray(Proto.MAX_PACKET)
+		self.view = memoryview(self.buf)
+
+	def _header(self, ptype):
+		""" """
+		Proto.HEADER.pack_into(self.buf, 0, Proto.MAGIC, Proto.VERSION, ptype)
+		return Proto.HEADER.size
+
+	def events(self, table_id, resent, records, snapshot=None):
+		""" table_id: key_table_id() of the key table the key ids refer to
+			resent, records: already sent and new (seq, time s, event type, key id)
+			tuples, in sequence order; up to MAX_EVENTS in total
+			snapshot: optional (seq, held key ids bitmask) """
+		off = start = self._header(Proto.PKT_EVENTS) + Proto.COUNT.size
+		for records_ in (resent, records):
+			for seq, time_s, typ, key_id in records_:
+				ts = int(time_s * 1000) & 0xFFFFFFFF
+				Proto.EVENT.pack_into(self.buf, off, seq & 0xFFFFFFFF, ts, typ, key_id)
+				off += Proto.EVENT.size
+		count = (off - start) // Proto.EVENT.size
+
+		snap_len = 0
+		if snapshot is not None:
+			snap_seq, held = snapshot
+			snap_len = max(1, (held.bit_length() + 7) // 8)
+			Proto.SNAPSHOT.pack_into(self.buf, off, snap_seq & 0xFFFFFFFF)
+			off += Proto.SNAPSHOT.size
+			self.buf[off:off + snap_len] = held.to_bytes(snap_len, 'little')
+			off += snap_len
+
+		Proto.COUNT.pack_into(self.buf, Proto.HEADER.size, count, len(resent), snap_len, table_id)
+		return self.view[:off]
+
+	def key_table(self, names):
+		""" """
+		off = self._header(Proto.PKT_KEY_TABLE)
+		data = Proto.KEY_SEP.join(name.encode('utf-8') for name in names)
+		if off + len(data) > len(self.buf):
+			raise ValueError(f'key table too large ({len(names)} keys)')
+		self.buf[off:off + len(data)] = data
+		return self.view[:off + len(data)]
+
+	def disconnect(self):
+		""" """
+		return self.view[:self._header(Proto.PKT_DISCONNECT)]
 
 
-def new_event(typ, name):
-	""" """
-	return f'{typ}|{name}'
+def key_table_id(names):
+	""" Identifies a key table's contents, so the host can tell if it has
+		the table a PKT_EVENTS packet refers to """
+	return zlib.crc32(Proto.KEY_SEP.join(name.encode('utf-8') for name in names))
 
 
-def parse_event(q_ev):
-	""" """
-	spl = q_ev.split('|')
-	if len(spl) > 1:
-		return spl[0], spl[1]
-	return spl[0], ''
+def decode_packet(data):
+	""" Returns (packet type, payload); raises ValueError on malformed data
+		- PKT_EVENTS:     (key table id, resent count, iterator of (seq, timestamp ms, event type, key id),
+		                   (seq, held key ids bitmask) snapshot or None)
+		- PKT_KEY_TABLE:  list of key names
+		- PKT_DISCONNECT: None
+	"""
+	if len(data) < Proto.HEADER.size:
+		raise ValueError(f'short packet ({len(data)}B)')
+	magic, version, ptype = Proto.HEADER.unpack_from(data)
+	if magic != Proto.MAGIC:
+		raise ValueError('bad magic')
+	if version != Proto.VERSION:
+		raise ValueError(f'unsupported protocol version {version}')
+
+	body = memoryview(data)[Proto.HEADER.size:]
+	if ptype == Proto.PKT_EVENTS:
+		# whole batch is validated up front so it is applied all or nothing
+		if len(body) < Proto.COUNT.size:
+			raise ValueError('missing event count')
+		count, resent, snap_len, table_id = Proto.COUNT.unpack_from(body)
+		body = body[Proto.COUNT.size:]
+		events_len = count * Proto.EVENT.size
+		snap_size = Proto.SNAPSHOT.size + snap_len if snap_len else 0
+		if not (count or snap_len) or resent > count or len(body) != events_len + snap_size:
+			raise ValueError(f'bad events payload ({count} events, {snap_len}B snapshot, {len(body)}B)')
+
+		snapshot = None
+		if snap_len:
+			snap_seq, = Proto.SNAPSHOT.unpack_from(body, events_len)
+			snapshot = snap_seq, int.from_bytes(body[events_len + Proto.SNAPSHOT.size:], 'little')
+		return ptype, (table_id, resent, Proto.EVENT.iter_unpack(body[:events_len]), snapshot)
+	elif ptype == Proto.PKT_KEY_TABLE:
+		raw = bytes(body)
+		return ptype, raw.decode('utf-8').split(Proto.KEY_SEP.decode()) if raw else []
+	elif ptype == Proto.PKT_DISCONNECT:
+		return ptype, None
+	raise ValueError(f'unknown packet type {ptype}')
+
+
+class ClientKeyTable:
+	def __init__(self, names, grow=False):
+		""" Client side key name <-> key id table, sent to host as PKT_KEY_TABLE
+			grow: assign new ids for unknown names (TRACK_ALL) """
+		self.names = list(names)
+		self.ids = {name: i for i, name in enumerate(self.names)}
+		self.grow = grow
+		self.dirty = True # current table not sent yet
+		self.table_id = key_table_id(self.names)
+
+	def key_id(self, name):
+		""" """
+		try:
+			return self.ids[name]
+		except KeyError:
+			if not self.grow:
+				raise
+		self.ids[name] = len(self.names)
+		self.names.append(name)
+		self.dirty = True
+		self.table_id = key_table_id(self.names)
+		return self.ids[name]
+
+
+class HostKeyState:
+	def __init__(self, player_controls):
+		""" Host keys injected on behalf of players, reference counted so a
+			key shared by several players is released by its last holder """
+		self.host_keys = [] # host key index -> host key (as in config)
+		self.player_keys = {} # player id -> {client key name: host key index}
+
+		index = {}
+		for player_id, controls in player_controls.items():
+			self.player_keys[player_id] = mapping = {}
+			for client_key, host_key in controls.items():
+				if host_key not in index:
+					index[host_key] = len(self.host_keys)
+					self.host_keys.append(host_key)
+				mapping[client_key] = index[host_key]
+
+		self.refs = array.array('H', bytes(2 * len(self.host_keys))) # host key index -> holders
+		self.held = 0 # number of host keys currently down
+		self.host_codes = list(self.host_keys) # host key index -> scan codes (or name if unresolved)
+
+	def compile(self):
+		""" Resolves every host key to its scan codes once, so injecting
+			goes straight to kbd.send_scan_codes for each remote event """
+		for idx, host_key in enumerate(self.host_keys):
+			try:
+				steps = kbd.parse_hotkey(host_key)
+				if len(steps) != 1:
+					raise ValueError('multi-step hotkeys can\'t be held down')
+				if not all(steps[0]):
+					raise ValueError('key not mapped to any scan code')
+				self.host_codes[idx] = tuple(scan_codes[0] for scan_codes in steps[0])
+			except ValueError as e:
+				# keep the name; kbd resolves it (or fails loudly) on each use
+				log_event(f'unable to resolve host key {host_key!r}: {e}', level=Config.LOG_ERROR)
+				self.host_codes[idx] = host_key
+		log_event(f'host keys: {dict(zip(self.host_keys, self.host_codes))}', level=Config.LOG_DEBUG)
+
+	def inject(self, idx, down):
+		""" Presses/releases a host key; chords are released in reverse """
+		codes = self.host_codes[idx]
+		if isinstance(codes, str):
+			kbd.press(codes) if down else kbd.release(codes)
+		else:
+			kbd.send_scan_codes(codes if down else reversed(codes), down)
+
+	def key_map(self, player_id, key_table):
+		""" Dense client key id -> host key index table (-1 = unmapped) """
+		mapping = self.player_keys.get(player_id, {})
+		return array.array('i', (mapping.get(name, -1) for name in key_table))
+
+	def acquire(self, idx):
+		""" Returns True if the host key went down (first holder) """
+		self.refs[idx] += 1
+		if self.refs[idx] == 1:
+			self.held += 1
+			return True
+		return False
+
+	def release(self, idx):
+		""" Returns True if the host key went up (last holder let go) """
+		if not self.refs[idx]:
+			return False
+		self.refs[idx] -= 1
+		if not self.refs[idx]:
+			self.held -= 1
+			return True
+		return False
+
+	def release_all(self):
+		""" Releases every host key still down, whoever holds it """
+		for idx, refs in enumerate(self.refs):
+			if refs:
+				self.refs[idx] = 0
+				self.held -= 1
+				self.inject(idx, False)
+
+
+class Peer:
+	def __init__(self, addr):
+		""" Host side state of a single remote client """
+		self.addr = addr
+		self.key_table = [] # client key id -> client key name
+		self.table_id = None # key_table_id of key_table, None until one arrives
+		self.table_missing = False # already warned that events refer to a table we don't have
+		self.unknown_ids = set() # key ids outside key_table, already reported
+		self.key_map = None # client key id -> host key index, see HostKeyState.key_map
+		self.player_id = None # player key_map was built for
+		self.last_seq = None # newest applied event sequence number
+		self.lost = 0 # events missed even with the resent ones
+		self.recovered = 0 # events applied from a resent copy
+		self.resynced = 0 # events skipped because a snapshot already covered them
+		self.held = 0 # bitmask of client key ids the host holds down for this peer (see HostKeyState)
+		self.last_seen = time.monotonic()
+
+	def accept(self, seq, resent):
+		""" Returns True if event `seq` wasn't applied yet; counts losses/recoveries
+			resent: if this copy of the event was a redundant resend """
+		if self.last_seq is not None:
+			if seq <= self.last_seq:
+				return False # duplicate, already applied from an earlier packet
+			if seq > self.last_seq + 1:
+				missed = seq - self.last_seq - 1
+				self.lost += missed
+				log_event(f'{self.addr} lost {missed} events (#{self.last_seq + 1}..#{seq - 1}), {self.stats()}', level=Config.LOG_WARN)
+		if resent:
+			self.recovered += 1
+			log_event(f'{self.addr} recovered #{seq}, {self.stats()}', level=Config.LOG_DEBUG)
+		self.last_seq = seq
+		return True
+
+	def accept_snapshot(self, seq):
+		""" Returns True if a snapshot taken after event `seq` is not stale """
+		if self.last_seq is not None:
+			if seq < self.last_seq:
+				return False
+			if seq > self.last_seq:
+				self.resynced += seq - self.last_seq
+				log_event(f'{self.addr} resynced past #{self.last_seq + 1}..#{seq}, {self.stats()}', level=Config.LOG_WARN)
+		self.last_seq = seq
+		return True
+
+	def stats(self):
+		""" """
+		return f'lost {self.lost} recovered {self.recovered} resynced {self.resynced}'
+
+
+class Waker:
+	def __init__(self):
+		""" Self-pipe registered next to sockets so selector waits can be
+			interrupted on shutdown (socketpair also works on Windows) """
+		self.r, self.w = socket.socketpair()
+		self.r.setblocking(False)
+		self.w.setblocking(False)
+
+	def fileno(self):
+		""" """
+		return self.r.fileno()
+
+	def wake(self):
+		""" """
+		try:
+			self.w.send(b'\0')
+		except OSError:
+			pass # already full or closed; a wakeup is pending either way
+
+	def drain(self):
+		""" """
+		try:
+			while self.r.recv(64):
+				pass
+		except OSError:
+			pass
+
+	def close(self):
+		""" """
+		self.r.close()
+		self.w.close()
 
 
 class HotkeyTracker:
@@ -109,7 +439,7 @@ class HotkeySimple(HotkeyTracker):
 
 					# still note down keypress
 					if g_tracking:
-						g_key_queue.put(new_event(Config.EVENT_KEYPRESS, event.name))
+						g_emit(new_event(Config.EVENT_KEYPRESS, event.name, event.time))
 						log_event(f'pressed: {event.name}')
 
 					return self.cb(event) or 0
@@ -139,13 +469,19 @@ g_running = True
 g_tracking = False
 g_triggers = False
 g_key_queue = queue.Queue()
+g_emit = g_key_queue.put # input handler hands client events (see new_event), () and QUEUE_CLOSED to this
+g_waker = None # Waker, created by main() for the host server thread
 g_hotkeys = [
 	HotkeySimple(Config.KEY_EXIT_LOOP.split('+'), lambda _: trigger_exit() or -1),
 	HotkeySimple(['ctrl','c'], lambda _: log_event(f'forcibly exiting (ctrl+c)', level=Config.LOG_WARN) or os.kill(os.getpid(), signal.SIGTERM)),
 ]
 g_kind = None # host,client
 g_addr_player_mapping = {} # filled dynamically as players "connect"
+g_peers = {} # addr -> Peer, filled dynamically as packets arrive
+g_held_keys = frozenset() # tracked keys held on the client, replaced (never mutated) by input thread
+g_input_events = None # kbd.subscribe() stream read by the input thread, closed by trigger_exit()
 g_player_controls_mapping = {} # loaded from disk (as json) on startup
+g_host_key_state = None # HostKeyState, built from g_player_controls_mapping on host start
 
 
 def trigger_exit():
@@ -153,11 +489,31 @@ def trigger_exit():
 	global g_tracking, g_running
 
 	if g_kind == Config.CLIENT:
-		g_key_queue.put(new_event(Config.EVENT_DISCONNECT, None))
-		time.sleep(1) # wait until sent
-	
+		# client thread sends this before it reaches QUEUE_CLOSED
+		g_emit(new_event(Config.EVENT_DISCONNECT, None))
+
 	g_tracking = False
 	g_running = False
+	g_emit(Config.QUEUE_CLOSED)
+	if g_waker is not None:
+		g_waker.wake()
+	if g_input_events is not None:
+		g_input_events.close()
+
+
+def is_tracked(name):
+	""" """
+	return Config.TRACK_ALL or name in Config.KEYS_TRACKED
+
+
+def publish_held_keys(was_pressed):
+	""" Replaces g_held_keys with the tracked keys currently held down;
+		must happen before the matching event is queued """
+	global g_held_keys
+	if g_tracking:
+		g_held_keys = frozenset(name for name, down in was_pressed.items() if down and is_tracked(name))
+	else:
+		g_held_keys = frozenset()
 
 
 def xXxRealHandleKeypressxXx(event, was_pressed: dict):
@@ -193,72 +549,104 @@ def xXxRealHandleKeypressxXx(event, was_pressed: dict):
 		return Config.PRESS_RELEASED
 
 
-def input_thread_func():
-	""" """
-	global g_running, g_tracking, g_triggers
+def restrict_input_devices(kind):
+	""" Listen only to devices that can emit a key we use (linux only) """
+	keys = [Config.KEY_EXIT_LOOP, Config.KEY_ACTIVATE_TRACKING, Config.KEY_ACTIVATE_TRIGGERS]
+	if kind == Config.CLIENT:
+		if Config.TRACK_ALL or not Config.KEYS_TRACKED:
+			return
+		keys.extend(Config.KEYS_TRACKED)
+
+	try:
+		if kbd.listen_only_to(keys, grab=Config.GRAB_DEVICES and kind == Config.CLIENT):
+			log_event(f'listening only to devices with keys: {keys}', level=Config.LOG_DEBUG)
+	except ValueError as e:
+		log_event(f'not filtering input devices: {e}', level=Config.LOG_WARN)
 
-	# await user selection in case started early
-	while not g_kind:
-		time.sleep(0.5)
 
+def init_tracked_keys():
+	""" """
 	if g_kind == Config.CLIENT and len(Config.KEYS_TRACKED) < 1:
 		Config.TRACK_ALL = True
 		log_event(f'tracking ALL keys', level=Config.LOG_WARN)
 
-	was_pressed = {}
-	while g_running:
-		event = kbd.read_event() # suppress=g_tracking)
 
-		stat = xXxRealHandleKeypressxXx(event, was_pressed)
-		if stat == Config.PRESS_SHOULD_BREAK:
-			trigger_exit()
-			break
+def handle_input_event(event, was_pressed):
+	""" Applies a single keyboard event, shared by the input thread and the
+		async input task; returns False once input should stop """
+	global g_tracking, g_triggers
 
-		if stat == Config.PRESS_PRESSED:
-			# parse hotkeys
-			for hk in g_hotkeys:
-				if hk.check(event) < 0:
-					break
-			if not g_running:
-				break
+	stat = xXxRealHandleKeypressxXx(event, was_pressed)
+	if stat == Config.PRESS_SHOULD_BREAK:
+		trigger_exit()
+		return False
 
-			# parse the rest
-			if event.name == Config.KEY_ACTIVATE_TRACKING and g_kind != Config.HOST:
-				g_tracking = not g_tracking
-				if g_tracking:
-					log_event(f'tracking active [{Config.KEY_ACTIVATE_TRACKING.upper()}]', level=Config.LOG_WARN)
-				else:
-					log_event(f'tracking disabled [{Config.KEY_ACTIVATE_TRACKING.upper()}]', level=Config.LOG_WARN)
+	if g_kind == Config.CLIENT and stat in (Config.PRESS_PRESSED, Config.PRESS_RELEASED):
+		publish_held_keys(was_pressed)
 
-			elif event.name == Config.KEY_ACTIVATE_TRIGGERS and g_kind == Config.HOST:
-				g_triggers = not g_triggers
-				if g_triggers:
-					log_event(f'triggers active [{Config.KEY_ACTIVATE_TRIGGERS.upper()}]', level=Config.LOG_WARN)
-				else:
-					log_event(f'triggers disabled [{Config.KEY_ACTIVATE_TRIGGERS.upper()}]', level=Config.LOG_WARN)
+	if stat == Config.PRESS_PRESSED:
+		# parse hotkeys
+		for hk in g_hotkeys:
+			if hk.check(event) < 0:
+				break
+		if not g_running:
+			return False
+
+		# parse the rest
+		if event.name == Config.KEY_ACTIVATE_TRACKING and g_kind != Config.HOST:
+			g_tracking = not g_tracking
+			publish_held_keys(was_pressed)
+			if g_tracking:
+				# (re)announce key table in case host restarted in the meantime
+				g_emit(new_event(Config.EVENT_KEY_TABLE, None))
+				log_event(f'tracking active [{Config.KEY_ACTIVATE_TRACKING.upper()}]', level=Config.LOG_WARN)
+			else:
+				log_event(f'tracking disabled [{Config.KEY_ACTIVATE_TRACKING.upper()}]', level=Config.LOG_WARN)
 
+		elif event.name == Config.KEY_ACTIVATE_TRIGGERS and g_kind == Config.HOST:
+			g_triggers = not g_triggers
+			g_emit(()) # wake host to release held keys
+			if g_triggers:
+				log_event(f'triggers active [{Config.KEY_ACTIVATE_TRIGGERS.upper()}]', level=Config.LOG_WARN)
 			else:
-				if not g_tracking:
-					continue
+				log_event(f'triggers disabled [{Config.KEY_ACTIVATE_TRIGGERS.upper()}]', level=Config.LOG_WARN)
 
-				if g_kind == Config.CLIENT and (Config.TRACK_ALL or event.name in Config.KEYS_TRACKED):
-					g_key_queue.put(new_event(Config.EVENT_KEYPRESS, event.name))
-					log_event(f'pressed: {event.name}')
+		elif g_tracking and g_kind == Config.CLIENT and is_tracked(event.name):
+			g_emit(new_event(Config.EVENT_KEYPRESS, event.name, event.time))
+			log_event(f'pressed: {event.name}')
 
-		elif stat == Config.PRESS_RELEASED:
-			if not g_tracking:
-				continue
+	elif stat == Config.PRESS_RELEASED:
+		if g_tracking and g_kind == Config.CLIENT and is_tracked(event.name):
+			g_emit(new_event(Config.EVENT_KEYRELEASE, event.name, event.time))
+			log_event(f'released: {event.name}')
+
+	return True
+
+
+def input_thread_func():
+	""" """
+	global g_input_events
+
+	# await user selection in case started early
+	while not g_kind:
+		time.sleep(0.5)
+
+	init_tracked_keys()
 
-			if g_kind == Config.CLIENT and event.name in Config.KEYS_TRACKED:
-				g_key_queue.put(new_event(Config.EVENT_KEYRELEASE, event.name))
-				log_event(f'released: {event.name}')
+	# one long-lived hook; events arriving between iterations are buffered
+	g_input_events = kbd.subscribe()
 
+	was_pressed = {}
+	for event in g_input_events:
+		if not g_running or not handle_input_event(event, was_pressed):
+			break
 
+	g_input_events.close()
 	log_event('exiting input thread...')
 
 
-def host_server_thread_func(host=None, port=None):
-	""" """
+def host_server_thread_func(host=None, port=None, dispatcher=None):
+	""" dispatcher: ShardDispatcher datagrams are handed to instead of g_key_queue """
 	# await user selection in case started early
 	while not g_kind:
 		time.sleep(0.5)
@@ -270,7 +658,8 @@ def host_server_thread_func(host=None, port=None):
 	if port is None:
 		port = Config.HOST_ON_PORT
 
-	with socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM) as serv:
+	with socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM) as serv, \
+	     selectors.DefaultSelector() as sel:
 		serv.setblocking(0)
 		try:
 			serv.bind((host, port))
@@ -281,94 +670,638 @@ def host_server_thread_func(host=None, port=None):
 
 		log_event(f'server started {serv.getsockname()}')
 
-		while g_running:
+		# sleep until a datagram arrives or trigger_exit() wakes us up
+		sel.register(serv, selectors.EVENT_READ)
+		sel.register(g_waker, selectors.EVENT_READ)
 
-			data, sender = None, None
-			while g_running and (data,sender)==(None,None):
-				try:
-					data, sender = serv.recvfrom(2048)
-				except BlockingIOError:
-					pass
-				time.sleep(Config.NB_LOOP_DELAY)
-			if not g_running:
-				break
+		while g_running:
+			for key, _ in sel.select():
+				if key.fileobj is g_waker:
+					g_waker.drain()
+					continue
 
-			g_key_queue.put((data, sender))
+				# drain everything that is already queued in the socket
+				while True:
+					try:
+						data, sender = serv.recvfrom(Proto.MAX_PACKET)
+					except BlockingIOError:
+						break
+					except ConnectionResetError:
+						continue # windows reports ICMP port unreachable here
+					if dispatcher is None:
+						g_key_queue.put((data, sender))
+					else:
+						dispatcher.put(data, sender)
+				if dispatcher is not None:
+					dispatcher.flush()
 
 	log_event('exiting host server thread...')
 
 
-def host_parse_thread_func():
+def find_player(sender):
+	""" Returns player id for sender, assigning a free slot if new; None if game is full """
+	try:
+		return g_addr_player_mapping[sender]
+	except KeyError:
+		pass
+
+	curr_players = len(g_addr_player_mapping)
+	max_players = len(g_player_controls_mapping)
+
+	# check if theres enough space and add new player
+	if curr_players < max_players:
+		g_addr_player_mapping[sender] = curr_players
+		log_event(f'player {curr_players} connected {sender}')
+		return curr_players
+
+	# if not log error and continue;
+	capac = f'{curr_players}/{max_players}' # print capacity for sanity check
+	log_event(f'new player attempted to connect but game full {capac} {sender}', level=Config.LOG_ERROR)
+	return None
+
+
+def host_set_key(peer, player_id, key_id, down):
+	""" Presses or releases the host key mapped to a client key of this player;
+		only real transitions reach the OS, repeated presses/releases are dropped """
+	bit = 1 << key_id
+	if bool(peer.held & bit) == down:
+		return # autorepeat, resent packet or snapshot already applied
+	if down and not g_triggers:
+		return # releases still go through so nothing stays stuck
+
+	sender = peer.addr
+	if peer.key_map is None or peer.player_id != player_id:
+		peer.key_map = g_host_key_state.key_map(player_id, peer.key_table)
+		peer.player_id = player_id
+
+	try:
+		# find key mapping
+		idx = peer.key_map[key_id]
+	except IndexError:
+		# reported once; state is still tracked so snapshots don't retry it
+		if key_id not in peer.unknown_ids:
+			peer.unknown_ids.add(key_id)
+			log_event(f'unknown key id {key_id} from {sender}, not in its key table', level=Config.LOG_ERROR)
+		peer.held ^= bit
+		return
+	if idx < 0:
+		# if doesn't exist log error and continue; state is still tracked so
+		# snapshots don't report it again
+		if down:
+			log_event(f'player control mapping doesn\'t exist {sender} -> {peer.key_table[key_id]}', level=Config.LOG_ERROR)
+		peer.held ^= bit
+		return
+
+	# trigger
+	if down:
+		peer.held |= bit
+		if g_host_key_state.acquire(idx):
+			g_host_key_state.inject(idx, True)
+			log_event(f'{sender}[player {player_id}]  TRIGGERED [PRE] {peer.key_table[key_id]} (-> HOST {g_host_key_state.host_keys[idx]})')
+	else:
+		peer.held &= ~bit
+		if g_host_key_state.release(idx):
+			g_host_key_state.inject(idx, False)
+			log_event(f'{sender}[player {player_id}]  TRIGGERED [REL] {peer.key_table[key_id]} (-> HOST {g_host_key_state.host_keys[idx]})')
+
+
+def host_apply_snapshot(peer, player_id, held):
+	""" Issues only the presses/releases needed to make peer.held match `held` """
+	changed = peer.held ^ held
+	while changed:
+		bit = changed & -changed
+		changed ^= bit
+		host_set_key(peer, player_id, bit.bit_length() - 1, bool(held & bit))
+
+
+def host_release_all():
+	""" Releases every host key held for any player (e.g. triggers disabled) """
+	for peer in list(g_peers.values()):
+		player_id = g_addr_player_mapping.get(peer.addr)
+		if player_id is not None:
+			host_apply_snapshot(peer, player_id, 0)
+
+
+def host_release_stale_peers():
+	""" Releases keys held for peers that went silent (crashed or unplugged) """
+	now = time.monotonic()
+	for peer in list(g_peers.values()):
+		if peer.held and now - peer.last_seen > Config.PEER_TIMEOUT:
+			player_id = g_addr_player_mapping.get(peer.addr)
+			log_event(f'{peer.addr}[player {player_id}] silent for {Config.PEER_TIMEOUT}s, releasing held keys', level=Config.LOG_WARN)
+			if player_id is None:
+				peer.held = 0
+			else:
+				host_apply_snapshot(peer, player_id, 0)
+
+
+def host_replace_key_table(peer, names):
+	""" Releases held keys whose id means another key in the new table (with
+		the old key map); a table that isn't an append-only extension is a
+		restarted client, so its sequence numbers start over too """
+	old = peer.key_table
+	player_id = g_addr_player_mapping.get(peer.addr)
+	held = peer.held
+	while held:
+		bit = held & -held
+		held ^= bit
+		key_id = bit.bit_length() - 1
+		if key_id < len(old) and key_id < len(names) and old[key_id] == names[key_id]:
+			continue
+		if player_id is None:
+			peer.held &= ~bit
+		else:
+			host_set_key(peer, player_id, key_id, False)
+
+	if names[:len(old)] != old:
+		peer.last_seq = None
+
+
+def host_handle_packet(data, sender):
 	""" """
-	global g_addr_player_mapping
+	try:
+		ptype, payload = decode_packet(data)
+	except ValueError as e:
+		log_event(f'malformed packet from {sender}: {e}', level=Config.LOG_WARN)
+		return
+
+	if ptype == Proto.PKT_EVENTS:
+		peer = g_peers.get(sender)
+		if peer is None:
+			peer = g_peers[sender] = Peer(sender)
+		peer.last_seen = time.monotonic()
 
+		# find or create player
+		player_id = find_player(sender)
+		if player_id is None:
+			return
+
+		table_id, resent, records, snapshot = payload
+		if table_id != peer.table_id:
+			# key ids would be looked up in the wrong table; the client resends
+			# its table every SNAPSHOT_INTERVAL and the next snapshot resyncs
+			if not peer.table_missing:
+				peer.table_missing = True
+				log_event(f'{sender} uses a key table not received yet, waiting for it', level=Config.LOG_WARN)
+			return
+
+		for i, (seq, ts, typ, key_id) in enumerate(records):
+			if not peer.accept(seq, i < resent):
+				continue
+			log_event(f'{sender} #{seq} @{ts} {typ}:{key_id}', level=Config.LOG_DEBUG)
+			host_set_key(peer, player_id, key_id, typ == Proto.EV_PRESS)
+
+		if snapshot is not None:
+			snap_seq, held = snapshot
+			if peer.accept_snapshot(snap_seq):
+				host_apply_snapshot(peer, player_id, held)
+
+	elif ptype == Proto.PKT_KEY_TABLE:
+		peer = g_peers.get(sender)
+		if peer is None:
+			peer = g_peers[sender] = Peer(sender)
+		table_id = key_table_id(payload)
+		if table_id == peer.table_id:
+			return # periodic resend of the table we already have
+		host_replace_key_table(peer, payload)
+		peer.key_table = payload
+		peer.key_map = None
+		peer.table_id = table_id
+		peer.table_missing = False
+		peer.unknown_ids.clear()
+		log_event(f'key table from {sender}: {payload}', level=Config.LOG_DEBUG)
+
+	elif ptype == Proto.PKT_DISCONNECT:
+		peer = g_peers.pop(sender, None)
+		if sender in g_addr_player_mapping:
+			if peer is not None:
+				host_apply_snapshot(peer, g_addr_player_mapping[sender], 0)
+			stats = f' ({peer.stats()})' if peer else ''
+			log_event(f'player {g_addr_player_mapping[sender]} {sender} disconnected{stats}')
+			del g_addr_player_mapping[sender]
+
+
+def host_parse_thread_func():
+	""" """
 	# await user selection in case started early
 	while not g_kind:
 		time.sleep(0.5)
 	if g_kind != Config.HOST:
 		return
 
-	while g_running:
-
-		data = None
-		while g_running and data is None:
-			try:
-				data, sender = g_key_queue.get(block=False)
-			except queue.Empty:
-				pass
-			time.sleep(Config.NB_LOOP_DELAY)
-		if not g_running:
+	next_sweep = time.monotonic() + Config.SNAPSHOT_INTERVAL
+	while True:
+		try:
+			item = g_key_queue.get(timeout=Config.SNAPSHOT_INTERVAL)
+		except queue.Empty:
+			item = ()
+		if item is Config.QUEUE_CLOSED or not g_running:
 			break
 
-		typ, data = parse_event(data.decode('utf-8'))
+		if item:
+			host_handle_packet(*item)
 
-		if typ in [Config.EVENT_KEYPRESS, Config.EVENT_KEYRELEASE]:
-			# find or create player
-			player_id = None
-			try:
-				player_id = g_addr_player_mapping[sender]
+		if not g_triggers and g_host_key_state.held:
+			host_release_all()
 
-			except KeyError:
-				curr_players = len(g_addr_player_mapping)
-				max_players = len(g_player_controls_mapping)
-
-				# check if theres enough space and add new player
-				if curr_players < max_players:
-					g_addr_player_mapping[sender] = curr_players
-					player_id = curr_players
-					log_event(f'player {player_id} connected {sender}')
-				else:
-					# if not log error and continue;
-					capac = f'{curr_players}/{max_players}' # print capacity for sanity check
-					log_event(f'new player attempted to connect but game full {capac} {sender}', level=Config.LOG_ERROR)
-					continue
+		if time.monotonic() >= next_sweep:
+			host_release_stale_peers()
+			next_sweep = time.monotonic() + Config.SNAPSHOT_INTERVAL
 
-			try:
-				# find key mapping
-				keypr = g_player_controls_mapping[player_id][data]
-
-				# trigger
-				if g_triggers:
-					if typ == Config.EVENT_KEYPRESS:
-						log_event(f'{sender}[player {player_id}]  TRIGGERED [PRE] {data} (-> HOST {keypr})')
-						kbd.press(keypr)
-					elif typ == Config.EVENT_KEYRELEASE:
-						log_event(f'{sender}[player {player_id}]  TRIGGERED [REL] {data} (-> HOST {keypr})')
-						kbd.release(keypr)
+	# don't leave anything stuck down on the host after exit
+	host_release_all()
+	log_event('exiting host parse thread...')
+
+
+class ShmRing:
+	HEADER = struct.Struct('QQ') # published head, tail (records written, read)
+	LENGTH = struct.Struct('H')
+
+	def __init__(self, record_size, slots, ready=None):
+		""" Single producer, single consumer ring of records up to
+			`record_size` bytes in shared memory, passed to worker processes
+			as an argument. The consumer blocks on `ready` (a semaphore,
+			possibly shared by several rings), released once per publish() """
+		import multiprocessing as mp
+		from multiprocessing import shared_memory
+		self.slot_size = self.LENGTH.size + record_size
+		self.slots = slots
+		self.ready = mp.Semaphore(0) if ready is None else ready
+		self.shm = shared_memory.SharedMemory(create=True, size=self.HEADER.size + self.slot_size * slots)
+		self.owner = True
+		self._attach()
+
+	def __getstate__(self):
+		""" """
+		return self.slot_size, self.slots, self.ready, self.shm.name
 
+	def __setstate__(self, state):
+		""" """
+		from multiprocessing import shared_memory
+		self.slot_size, self.slots, self.ready, name = state
+		self.shm = shared_memory.SharedMemory(name=name)
+		self.owner = False
+		self._attach()
+
+	def _attach(self):
+		""" """
+		self.buf = self.shm.buf
+		self.head, self.tail = self.HEADER.unpack_from(self.buf) # producer's / consumer's own copy
+		self.published = self.head
+
+	def put(self, *parts):
+		""" Producer: writes one record made of `parts`, visible to the
+			consumer after publish(); returns False if the ring is full """
+		if self.head - self.HEADER.unpack_from(self.buf)[1] >= self.slots:
+			return False
+		off = self.HEADER.size + (self.head % self.slots) * self.slot_size
+		end = off + self.LENGTH.size
+		for part in parts:
+			self.buf[end:end + len(part)] = part
+			end += len(part)
+		self.LENGTH.pack_into(self.buf, off, end - off - self.LENGTH.size)
+		self.head += 1
+		return True
+
+	def publish(self):
+		""" Producer: makes records put so far visible and wakes the consumer """
+		if self.head != self.published:
+			struct.pack_into('Q', self.buf, 0, self.head)
+			self.published = self.head
+			self.ready.release()
+
+	def drain(self):
+		""" Consumer: returns all published records not read yet """
+		head = self.HEADER.unpack_from(self.buf)[0]
+		records = []
+		while self.tail < head:
+			off = self.HEADER.size + (self.tail % self.slots) * self.slot_size
+			length, = self.LENGTH.unpack_from(self.buf, off)
+			off += self.LENGTH.size
+			records.append(bytes(self.buf[off:off + length]))
+			self.tail += 1
+		if records:
+			struct.pack_into('Q', self.buf, 8, self.tail)
+		return records
+
+	def get_batch(self, timeout=None):
+		""" Consumer: drain(), after waiting up to `timeout` for a publish() """
+		if not self.ready.acquire(timeout=timeout):
+			return []
+		return self.drain()
+
+	def close(self):
+		""" """
+		self.buf = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+
+class ShardKeyState(HostKeyState):
+	def __init__(self, player_controls, ring):
+		""" HostKeyState of a shard worker: host key transitions of its own
+			peers go to the injector through `ring`, reference counting
+			across shards happens there """
+		super(ShardKeyState, self).__init__(player_controls)
+		self.ring = ring
+
+	def acquire(self, idx):
+		""" """
+		return True
+
+	def release(self, idx):
+		""" """
+		return True
+
+	def inject(self, idx, down):
+		""" """
+		record = ShardDispatcher.RESULT.pack(idx, down)
+		while not self.ring.put(record):
+			# injector fell behind; wait instead of losing a transition
+			self.ring.publish()
+			time.sleep(0.001)
+
+
+class ShardDispatcher:
+	# record kind, player id (-1 = none), sender ip, sender port; datagram follows
+	RECORD = struct.Struct('!Bh4sH')
+	REC_DATAGRAM      = 0
+	REC_TRIGGERS_ON   = 1
+	REC_TRIGGERS_OFF  = 2
+	REC_STOP          = 3
+	# host key index, pressed
+	RESULT = struct.Struct('!HB')
+
+	INBOX_SLOTS  = 1024
+	OUTBOX_SLOTS = 4096
+
+	def __init__(self, shards):
+		""" Host side of Config.HOST_SHARDS: the server thread hands each
+			datagram to the worker process its sender hashes to, workers
+			decode and map them and the injector thread presses the keys """
+		# only sharded hosts pay for importing multiprocessing
+		import multiprocessing as mp
+		self.lock = thr.Lock() # server and input thread both write inboxes
+		self.ready = mp.Semaphore(0) # shared by all outboxes
+		self.inboxes = [ShmRing(self.RECORD.size + Proto.MAX_PACKET, self.INBOX_SLOTS) for _ in range(shards)]
+		self.outboxes = [ShmRing(self.RESULT.size, self.OUTBOX_SLOTS, self.ready) for _ in range(shards)]
+		self.dropped = 0
+		self.dead = set() # shards whose worker exited, already reported
+
+		config = {k: v for k, v in vars(Config).items() if k.isupper()}
+		self.workers = [
+			mp.Process(target=host_shard_worker_func, name=f'genesa-shard-{i}', daemon=True,
+			           args=(i, inbox, outbox, g_player_controls_mapping, g_triggers, config))
+			for i, (inbox, outbox) in enumerate(zip(self.inboxes, self.outboxes))
+		]
+
+	def start(self):
+		""" """
+		for worker in self.workers:
+			worker.start()
+		log_event(f'started {len(self.workers)} host shards', level=Config.LOG_DEBUG)
+
+	def put(self, data, sender):
+		""" Player slots are assigned here so they stay unique across shards """
+		player_id = -1
+		if len(data) >= Proto.HEADER.size:
+			# anything else doesn't take a slot; the worker reports it as malformed
+			magic, version, ptype = Proto.HEADER.unpack_from(data)
+			if magic == Proto.MAGIC and version == Proto.VERSION:
+				if ptype == Proto.PKT_EVENTS:
+					player_id = find_player(sender)
+					if player_id is None:
+						return
+				elif ptype == Proto.PKT_DISCONNECT:
+					player_id = g_addr_player_mapping.pop(sender, -1)
+
+		header = self.RECORD.pack(self.REC_DATAGRAM, player_id, socket.inet_aton(sender[0]), sender[1])
+		shard = hash(sender) % len(self.inboxes)
+		with self.lock:
+			if not self.inboxes[shard].put(header, data):
+				self.dropped += 1
+				if self.shard_alive(shard):
+					log_event(f'host shard full, dropped packet from {sender} ({self.dropped} total)', level=Config.LOG_WARN)
+
+	def flush(self):
+		""" """
+		with self.lock:
+			for inbox in self.inboxes:
+				inbox.publish()
+
+	def control(self, kind):
+		""" Sends a REC_* control record to every worker """
+		header = self.RECORD.pack(kind, -1, bytes(4), 0)
+		with self.lock:
+			for shard, inbox in enumerate(self.inboxes):
+				while not inbox.put(header):
+					inbox.publish()
+					if not self.shard_alive(shard):
+						break # nobody left to drain it
+					time.sleep(0.001)
+				inbox.publish()
+
+	def shard_alive(self, shard):
+		""" Returns False if the worker of `shard` exited; reported once """
+		if self.workers[shard].is_alive():
+			return True
+		if shard not in self.dead:
+			self.dead.add(shard)
+			log_event(f'host shard {shard} exited (exit code {self.workers[shard].exitcode}), dropping its packets', level=Config.LOG_ERROR)
+		return False
+
+	def set_triggers(self, triggers):
+		""" """
+		self.control(self.REC_TRIGGERS_ON if triggers else self.REC_TRIGGERS_OFF)
+
+	def stop(self):
+		""" """
+		self.control(self.REC_STOP)
+
+	def alive(self):
+		""" """
+		return any(worker.is_alive() for worker in self.workers)
+
+	def close(self):
+		""" """
+		for worker in self.workers:
+			worker.join()
+		for ring in self.inboxes + self.outboxes:
+			ring.close()
+
+
+def host_shard_worker_func(shard, inbox, outbox, player_controls, triggers, config):
+	""" Worker process of a sharded host: decodes, validates and maps the
+		packets of its senders, as host_parse_thread_func would """
+	global g_kind, g_triggers, g_host_key_state
+
+	# ctrl+c reaches the whole process group; the host stops us itself
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	for k, v in config.items():
+		setattr(Config, k, v)
+	g_kind = Config.HOST
+	g_triggers = triggers
+	g_host_key_state = ShardKeyState(player_controls, outbox)
+	import multiprocessing as mp
+	parent = mp.parent_process()
+
+	running = True
+	next_sweep = time.monotonic() + Config.SNAPSHOT_INTERVAL
+	while running:
+		for record in inbox.get_batch(timeout=Config.SNAPSHOT_INTERVAL):
+			kind, player_id, ip, port = ShardDispatcher.RECORD.unpack_from(record)
+			if kind == ShardDispatcher.REC_DATAGRAM:
+				sender = (socket.inet_ntoa(ip), port)
+				if player_id >= 0:
+					g_addr_player_mapping[sender] = player_id
+				host_handle_packet(memoryview(record)[ShardDispatcher.RECORD.size:], sender)
+			elif kind == ShardDispatcher.REC_STOP:
+				running = False
+				break
+			else:
+				g_triggers = kind == ShardDispatcher.REC_TRIGGERS_ON
+				if not g_triggers:
+					host_release_all()
+
+		if time.monotonic() >= next_sweep:
+			host_release_stale_peers()
+			next_sweep = time.monotonic() + Config.SNAPSHOT_INTERVAL
+			if parent is not None and not parent.is_alive():
+				break
+		outbox.publish()
+
+	host_release_all()
+	outbox.publish()
+	log_event(f'exiting host shard {shard}...')
+
+
+def host_inject_thread_func(dispatcher):
+	""" Presses host keys for all shards, in the order their transitions
+		arrive; the only thread injecting keys on a sharded host """
+	running = True
+	while running:
+		dispatcher.ready.acquire(timeout=Config.SNAPSHOT_INTERVAL)
+		# workers publish everything before exiting, so read once more after that
+		running = dispatcher.alive()
+		for outbox in dispatcher.outboxes:
+			for record in outbox.drain():
+				idx, down = ShardDispatcher.RESULT.unpack(record)
+				if down:
+					if g_host_key_state.acquire(idx):
+						g_host_key_state.inject(idx, True)
+				elif g_host_key_state.release(idx):
+					g_host_key_state.inject(idx, False)
+
+	# don't leave anything stuck down on the host after exit (or a crashed shard)
+	g_host_key_state.release_all()
+	log_event('exiting host inject thread...')
+
+
+class ClientSender:
+	def __init__(self, sock, addr, keys):
+		""" Client side encoder state for a single host """
+		self.sock = sock
+		self.addr = addr
+		self.keys = keys
+		self.encoder = PacketEncoder()
+		self.seq = 1 # snapshots taken before the first event use 0
+		self.pending = [] # (seq, time s, event type, key id) waiting for flush()
+		self.history = collections.deque(maxlen=min(Config.REDUNDANT_EVENTS, Proto.MAX_EVENTS // 2)) # resent with the next packet
+		self.last_snapshot = 0 # held key ids bitmask last sent
+		self.table_sent = None # time.monotonic() of the last key table sent
+
+	def send_key_table(self):
+		""" """
+		self.sock.sendto(self.encoder.key_table(self.keys.names), self.addr)
+		self.keys.dirty = False
+		self.table_sent = time.monotonic()
+		log_event(f'-- sent key table {self.keys.names} to {self.addr}', level=Config.LOG_DEBUG)
+
+	def snapshot(self):
+		""" Bitmask of key ids for g_held_keys, published by the input thread """
+		held = 0
+		for name in g_held_keys:
+			try:
+				key_id = self.keys.key_id(name)
 			except KeyError:
-				# if doesn't exist log error and continue;
-				log_event(f'player control mapping doesn\'t exist {sender} -> {data}', level=Config.LOG_ERROR)
+				continue
+			if key_id < Proto.MAX_SNAPSHOT_KEYS:
+				held |= 1 << key_id
+		return held
+
+	def flush(self, force_snapshot=False):
+		""" Sends all pending events as a single datagram, along with the
+			current held keys snapshot """
+		if not self.pending and not force_snapshot:
+			return
+		held = self.snapshot()
+		# also resent every SNAPSHOT_INTERVAL; it may have been lost, or the host restarted
+		if self.keys.dirty or time.monotonic() - self.table_sent >= Config.SNAPSHOT_INTERVAL:
+			self.send_key_table()
+		packet = self.encoder.events(self.keys.table_id, self.history, self.pending, (self.seq - 1, held))
+		self.sock.sendto(packet, self.addr)
+		if self.pending:
+			log_event(f'-- sent #{self.pending[0][0]}..#{self.pending[-1][0]} (+{len(self.history)} resent) to {self.addr}', level=Config.LOG_DEBUG)
+		self.history.extend(self.pending)
+		self.pending.clear()
+		self.last_snapshot = held
+
+	def tick(self):
+		""" Called when idle for SNAPSHOT_INTERVAL; keeps the host in sync
+			while tracking, plus once more after tracking is disabled """
+		if g_tracking or self.snapshot() != self.last_snapshot:
+			self.flush(force_snapshot=True)
+
+	def send(self, next_event):
+		""" Encodes a queued client event (see new_event); key events are
+			held back until flush() so they share a datagram """
+		typ, name, time_s = next_event
+
+		if typ == Config.EVENT_KEY_TABLE:
+			self.flush()
+			self.send_key_table()
+			return
+		elif typ == Config.EVENT_DISCONNECT:
+			self.flush()
+			self.sock.sendto(self.encoder.disconnect(), self.addr)
+			log_event(f'-- sent disconnect to {self.addr}')
+			return
 
-		elif typ == EVENT_DISCONNECT:
-			if sender in g_addr_player_mapping:
-				log_event(f'player {g_addr_player_mapping[sender]} {sender} disconnected')
-				del g_addr_player_mapping[sender]
+		try:
+			key_id = self.keys.key_id(name)
+		except KeyError:
+			log_event(f'untracked key {name}, not sent', level=Config.LOG_DEBUG)
+			return
 
-		else:
-			log_event(f'(echo) {data} {sender}', level=Config.LOG_WARN)
+		ev_typ = Proto.EV_PRESS if typ == Config.EVENT_KEYPRESS else Proto.EV_RELEASE
+		self.pending.append((self.seq, time_s, ev_typ, key_id))
+		log_event(f'-- queued #{self.seq} {typ} {name} for {self.addr}')
+		self.seq += 1
+		if len(self.pending) + len(self.history) >= Proto.MAX_EVENTS:
+			self.flush()
 
-	log_event('exiting host parse thread...')
+
+def get_key_queue_batch(window, timeout=None):
+	""" Blocks for the next g_key_queue item, then also takes whatever is
+		already queued or arrives within `window` seconds.
+		QUEUE_CLOSED, if reached, is always the last item of the batch.
+		Returns an empty batch if nothing arrived within `timeout` """
+	try:
+		batch = [g_key_queue.get(timeout=timeout)]
+	except queue.Empty:
+		return []
+	deadline = time.monotonic() + window
+	while batch[-1] is not Config.QUEUE_CLOSED:
+		remaining = deadline - time.monotonic()
+		try:
+			if remaining > 0:
+				batch.append(g_key_queue.get(timeout=remaining))
+			else:
+				batch.append(g_key_queue.get_nowait())
+		except queue.Empty:
+			break
+	return batch
 
 
 def client_thread_func(host=None, port=None):
@@ -384,25 +1317,230 @@ def client_thread_func(host=None, port=None):
 	if port is None:
 		port = Config.CONNECT_TO_PORT
 
+	keys = ClientKeyTable(Config.KEYS_TRACKED, grow=Config.TRACK_ALL or not Config.KEYS_TRACKED)
+
 	with socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM) as serv:
-		while g_running:
+		sender = ClientSender(serv, (host, port), keys)
+		# runs until QUEUE_CLOSED so the disconnect queued by trigger_exit() is sent
+		running = True
+		while running:
+			batch = get_key_queue_batch(Config.BATCH_WINDOW, timeout=Config.SNAPSHOT_INTERVAL)
+			if not batch:
+				sender.tick()
+				continue
+			for next_event in batch:
+				if next_event is Config.QUEUE_CLOSED:
+					running = False
+					break
+				sender.send(next_event)
+			sender.flush()
+
+	log_event('exiting client thread...')
+
+
+class AsyncEndpoint:
+	def __init__(self, on_datagram=None):
+		""" Datagram socket for Config.ASYNC; packets are handled right on
+			the event loop as they arrive. A plain asyncio.DatagramProtocol
+			look-alike, so importing genesa doesn't import asyncio """
+		import asyncio
+		self.on_datagram = on_datagram
+		self.closed = asyncio.get_running_loop().create_future()
+
+	def connection_made(self, transport):
+		""" """
+
+	def pause_writing(self):
+		""" """
+
+	def resume_writing(self):
+		""" """
+
+	def datagram_received(self, data, addr):
+		""" """
+		if self.on_datagram is not None:
+			self.on_datagram(data, addr)
+
+	def error_received(self, exc):
+		""" """
+		# windows reports ICMP port unreachable here
+		log_event(f'socket error: {exc}', level=Config.LOG_DEBUG)
+
+	def connection_lost(self, exc):
+		""" """
+		if not self.closed.done():
+			self.closed.set_result(None)
+
+
+class AsyncClientSender(ClientSender):
+	def __init__(self, transport, addr, keys):
+		""" ClientSender driven by loop timers instead of get_key_queue_batch:
+			key events are flushed BATCH_WINDOW after the first one and
+			tick() runs after SNAPSHOT_INTERVAL without a flush """
+		import asyncio
+		super(AsyncClientSender, self).__init__(transport, addr, keys)
+		self.loop = asyncio.get_running_loop()
+		self.flush_handle = None
+		self.idle_handle = None
+		self.restart_idle()
+
+	def restart_idle(self):
+		""" """
+		if self.idle_handle is not None:
+			self.idle_handle.cancel()
+		self.idle_handle = self.loop.call_later(Config.SNAPSHOT_INTERVAL, self.on_idle)
+
+	def on_idle(self):
+		""" """
+		self.tick()
+		self.restart_idle()
+
+	def flush_soon(self):
+		""" """
+		if self.pending and self.flush_handle is None:
+			self.flush_handle = self.loop.call_later(Config.BATCH_WINDOW, self.flush)
+
+	def flush(self, force_snapshot=False):
+		""" """
+		if self.flush_handle is not None:
+			self.flush_handle.cancel()
+			self.flush_handle = None
+		super(AsyncClientSender, self).flush(force_snapshot)
+		self.restart_idle()
+
+	def close(self):
+		""" """
+		for handle in (self.flush_handle, self.idle_handle):
+			if handle is not None:
+				handle.cancel()
+
+
+async def async_every(interval, func):
+	""" """
+	import asyncio
+	while True:
+		await asyncio.sleep(interval)
+		func()
+
 
-			next_event = None
-			while g_running and next_event is None:
-				try:
-					next_event = g_key_queue.get(block=False)
-				except queue.Empty:
-					pass
-				time.sleep(Config.NB_LOOP_DELAY)
-			if not g_running:
+async def async_input_task():
+	""" Async counterpart of input_thread_func, fed by kbd.aevents() """
+	was_pressed = {}
+	events = kbd.aevents()
+	try:
+		async for event in events:
+			if not g_running or not handle_input_event(event, was_pressed):
 				break
-			
-			dat = next_event.encode('utf-8')
-			log_event(f'{(host, port)} : {dat}')
-			serv.sendto(dat, (host, port))
-			log_event(f'-- sent {dat} to {(host, port)}')
+	finally:
+		# removes the hook right away, also when cancelled
+		await events.aclose()
+	log_event('exiting input task...')
 
-	log_event('exiting client thread...')
+
+async def async_run_until_exit(transport, protocol, stop, tasks):
+	""" Waits for trigger_exit() (or cancellation, e.g. ctrl+c), then stops
+		`tasks` and closes `transport` before returning """
+	import asyncio
+	try:
+		await stop
+	finally:
+		if g_running:
+			trigger_exit()
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		# closing sends whatever is still buffered (e.g. the disconnect) first
+		transport.close()
+		await protocol.closed
+
+
+async def async_host_main(host=None, port=None):
+	""" Host with Config.ASYNC: socket, keyboard and stale peer sweep all
+		run on one event loop, no g_key_queue in between """
+	import asyncio
+	global g_emit
+
+	if host is None:
+		host = Config.HOST_ON_IP
+	if port is None:
+		port = Config.HOST_ON_PORT
+
+	loop = asyncio.get_running_loop()
+	stop = loop.create_future()
+
+	def emit(item):
+		if item is Config.QUEUE_CLOSED:
+			if not stop.done():
+				stop.set_result(None)
+		elif not g_triggers and g_host_key_state.held:
+			host_release_all()
+	g_emit = emit
+
+	try:
+		transport, protocol = await loop.create_datagram_endpoint(
+			lambda: AsyncEndpoint(host_handle_packet), local_addr=(host, port), family=socket.AF_INET)
+	except OSError:
+		log_event(f'unable to bind to {(host, port)}', level=Config.LOG_ERROR)
+		return
+	log_event(f'server started {transport.get_extra_info("sockname")}')
+
+	tasks = [
+		asyncio.ensure_future(async_input_task()),
+		asyncio.ensure_future(async_every(Config.SNAPSHOT_INTERVAL, host_release_stale_peers)),
+	]
+	try:
+		await async_run_until_exit(transport, protocol, stop, tasks)
+	finally:
+		# don't leave anything stuck down on the host after exit
+		host_release_all()
+	log_event('exiting host loop...')
+
+
+async def async_client_main(host=None, port=None):
+	""" Client with Config.ASYNC: keyboard events are encoded and sent on
+		the event loop as they arrive """
+	import asyncio
+	global g_emit
+
+	if host is None:
+		host = Config.CONNECT_TO_HOST
+	if port is None:
+		port = Config.CONNECT_TO_PORT
+
+	loop = asyncio.get_running_loop()
+	stop = loop.create_future()
+
+	keys = ClientKeyTable(Config.KEYS_TRACKED, grow=Config.TRACK_ALL or not Config.KEYS_TRACKED)
+	transport, protocol = await loop.create_datagram_endpoint(AsyncEndpoint, family=socket.AF_INET)
+	sender = AsyncClientSender(transport, (host, port), keys)
+
+	def emit(item):
+		if item is Config.QUEUE_CLOSED:
+			if not stop.done():
+				stop.set_result(None)
+		else:
+			sender.send(item)
+			sender.flush_soon()
+	g_emit = emit
+
+	try:
+		await async_run_until_exit(transport, protocol, stop, [asyncio.ensure_future(async_input_task())])
+	finally:
+		sender.close()
+	log_event('exiting client loop...')
+
+
+def run_async(kind):
+	""" Runs host or client on a single asyncio loop (Config.ASYNC); only
+		the keyboard library's own listener threads remain """
+	# imported here and in the async functions, not at the top: threaded
+	# runs don't need asyncio and it is slow to import
+	import asyncio
+	init_tracked_keys()
+	try:
+		asyncio.run(async_host_main() if kind == Config.HOST else async_client_main())
+	except KeyboardInterrupt:
+		pass
 
 
 def select_kind():
@@ -417,8 +1555,9 @@ def select_kind():
 			return None
 		return g_kind
 
-	if len(sys.argv) > 1:
-		kind = sys.argv[1]
+	args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+	if args:
+		kind = args[0]
 		if set_kind(kind): return kind
 		print(f'Invalid cmd kind')
 
@@ -467,9 +1606,17 @@ def load_config(filename=None):
 
 def main(argv):
 	""" """
-	global g_tracking
+	global g_tracking, g_host_key_state, g_emit, g_waker
 
 	load_config()
+	for arg in argv[1:]:
+		if arg == '--async':
+			Config.ASYNC = True
+		elif arg.startswith('--shards='):
+			try:
+				Config.HOST_SHARDS = int(arg[len('--shards='):])
+			except ValueError:
+				log_event(f'invalid shard count {arg}', level=Config.LOG_ERROR)
 
 	try:
 		kind = select_kind()
@@ -478,27 +1625,59 @@ def main(argv):
 	except KeyboardInterrupt:
 		return 0
 
+	#### 
+	if kind == Config.CLIENT:
+		log_event(f'exit bind [{Config.KEY_EXIT_LOOP.upper()}]')
+		log_event(f'tracking [{Config.KEY_ACTIVATE_TRACKING.upper()}]: {g_tracking}')
+	else: # == Config.HOST
+		g_tracking = False
+		g_host_key_state = HostKeyState(g_player_controls_mapping)
+		g_host_key_state.compile()
+
+		log_event(f'exit bind [{Config.KEY_EXIT_LOOP.upper()}]')
+		log_event(f'triggers [{Config.KEY_ACTIVATE_TRIGGERS.upper()}]: {g_triggers}')
+
+	restrict_input_devices(kind)
+
+	if Config.ASYNC:
+		if Config.HOST_SHARDS > 0:
+			log_event(f'host shards are not used in async mode', level=Config.LOG_WARN)
+		log_event('running on a single asyncio loop', level=Config.LOG_DEBUG)
+		run_async(kind)
+		return 0
+
+	dispatcher = None
+	if kind == Config.HOST and Config.HOST_SHARDS > 0:
+		# started before any other thread, workers may be forked
+		dispatcher = ShardDispatcher(Config.HOST_SHARDS)
+		dispatcher.start()
+
+		def emit(item):
+			if item is Config.QUEUE_CLOSED:
+				dispatcher.stop()
+			else:
+				dispatcher.set_triggers(g_triggers)
+		g_emit = emit
+
 	threads = {
 		'input_thread': 		thr.Thread(target=input_thread_func, daemon=True),
 		'client_thread': 		thr.Thread(target=client_thread_func, daemon=True),
-		'host_server_thread': 	thr.Thread(target=host_server_thread_func, daemon=True),
+		'host_server_thread': 	thr.Thread(target=host_server_thread_func, kwargs={'dispatcher': dispatcher}, daemon=True),
 		'host_parse_thread': 	thr.Thread(target=host_parse_thread_func, daemon=True),
+		'host_inject_thread': 	thr.Thread(target=host_inject_thread_func, args=(dispatcher,), daemon=True),
 	}
 
-	#### 
+	if kind == Config.HOST:
+		g_waker = Waker()
+
 	if kind == Config.CLIENT:
 		threads['client_thread'].start()
-		
-		log_event(f'exit bind [{Config.KEY_EXIT_LOOP.upper()}]')
-		log_event(f'tracking [{Config.KEY_ACTIVATE_TRACKING.upper()}]: {g_tracking}')
+	elif dispatcher is not None:
+		threads['host_server_thread'].start()
+		threads['host_inject_thread'].start()
 	else: # == Config.HOST
-		g_tracking = False
 		threads['host_server_thread'].start()
 		threads['host_parse_thread'].start()
-
-		log_event(f'exit bind [{Config.KEY_EXIT_LOOP.upper()}]')
-		log_event(f'triggers [{Config.KEY_ACTIVATE_TRIGGERS.upper()}]: {g_triggers}')
-
 	threads['input_thread'].start()
 
 	for t in threads.values():
@@ -508,6 +1687,10 @@ def main(argv):
 		except RuntimeError:
 			pass
 
+	if dispatcher is not None:
+		dispatcher.close()
+	if g_waker is not None:
+		g_waker.close()
 	return 0
 
 
@@ -0,0 +1,446 @@
+""" Wire protocol and host packet handling tests; keys are never injected,
+	HostKeyState.inject is replaced with a recorder
+"""
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+import genesa as g
+
+
+class FakeSocket:
+	def __init__(self):
+		""" """
+		self.sent = []
+
+	def sendto(self, data, addr):
+		""" """
+		self.sent.append(bytes(data))
+
+
+class TestProtocol(unittest.TestCase):
+	def test_events_round_trip(self):
+		""" """
+		encoder = g.PacketEncoder()
+		resent = [(7, 1.0, g.Proto.EV_PRESS, 1)]
+		records = [(8, 1.5, g.Proto.EV_RELEASE, 1), (9, 2.0, g.Proto.EV_PRESS, 300)]
+		packet = bytes(encoder.events(0xDEADBEEF, resent, records, (9, (1 << 300) | 1)))
+
+		ptype, (table_id, n_resent, events, snapshot) = g.decode_packet(packet)
+		self.assertEqual(ptype, g.Proto.PKT_EVENTS)
+		self.assertEqual(table_id, 0xDEADBEEF)
+		self.assertEqual(n_resent, 1)
+		self.assertEqual(list(events), [(7, 1000, 1, 1), (8, 1500, 2, 1), (9, 2000, 1, 300)])
+		self.assertEqual(snapshot, (9, (1 << 300) | 1))
+
+	def test_snapshot_only_round_trip(self):
+		""" """
+		packet = bytes(g.PacketEncoder().events(1, [], [], (0, 0)))
+		ptype, (table_id, n_resent, events, snapshot) = g.decode_packet(packet)
+		self.assertEqual((table_id, n_resent, list(events), snapshot), (1, 0, [], (0, 0)))
+
+	def test_key_table_round_trip(self):
+		""" """
+		names = ['left', 'right', 'x', 'ž']
+		ptype, payload = g.decode_packet(bytes(g.PacketEncoder().key_table(names)))
+		self.assertEqual(ptype, g.Proto.PKT_KEY_TABLE)
+		self.assertEqual(payload, names)
+		self.assertEqual(g.key_table_id(payload), g.key_table_id(names))
+		self.assertNotEqual(g.key_table_id(names), g.key_table_id(names[:-1]))
+
+	def test_disconnect_round_trip(self):
+		""" """
+		self.assertEqual(g.decode_packet(bytes(g.PacketEncoder().disconnect())), (g.Proto.PKT_DISCONNECT, None))
+
+	def test_malformed(self):
+		""" """
+		packet = bytes(g.PacketEncoder().events(0, [], [(1, 0, g.Proto.EV_PRESS, 0)]))
+		for data in (b'G', b'XX' + packet[2:], packet[:2] + b'\x00' + packet[3:], packet[:-1], packet + b'\x00'):
+			with self.assertRaises(ValueError):
+				g.decode_packet(data)
+
+
+class TestPeer(unittest.TestCase):
+	def setUp(self):
+		""" """
+		patcher = mock.patch.object(g, 'log_event')
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.peer = g.Peer(('10.0.0.2', 5000))
+
+	def test_accept_counts(self):
+		""" """
+		peer = self.peer
+		self.assertTrue(peer.accept(1, False))
+		self.assertFalse(peer.accept(1, False)) # duplicate
+		self.assertFalse(peer.accept(1, True)) # resent copy of an applied event
+		self.assertTrue(peer.accept(2, True)) # recovered from a resent copy
+		self.assertTrue(peer.accept(5, False)) # #3 and #4 lost
+		self.assertFalse(peer.accept(4, True)) # too late, already counted as lost
+		self.assertEqual((peer.last_seq, peer.lost, peer.recovered), (5, 2, 1))
+		self.assertEqual(peer.stats(), 'lost 2 recovered 1 resynced 0')
+
+	def test_first_event_not_lost(self):
+		""" """
+		self.assertTrue(self.peer.accept(100, False))
+		self.assertEqual((self.peer.lost, self.peer.recovered), (0, 0))
+
+	def test_accept_snapshot(self):
+		""" """
+		peer = self.peer
+		self.assertTrue(peer.accept_snapshot(3))
+		self.assertTrue(peer.accept_snapshot(3)) # nothing newer applied since
+		self.assertFalse(peer.accept_snapshot(2)) # taken before an applied event
+		self.assertTrue(peer.accept_snapshot(6)) # covers #4..#6
+		self.assertEqual((peer.last_seq, peer.resynced), (6, 3))
+		self.assertFalse(peer.accept(5, True))
+
+
+class TestHostPackets(unittest.TestCase):
+	sender = ('10.0.0.2', 5000)
+	other = ('10.0.0.3', 5000)
+
+	def setUp(self):
+		""" """
+		self.injected = []
+		g.g_peers.clear()
+		g.g_addr_player_mapping.clear()
+		g.g_player_controls_mapping.clear()
+		g.g_player_controls_mapping.update({0: {'x': 's', 'left': 'a'}, 1: {'right': 'a'}})
+		g.g_host_key_state = g.HostKeyState(g.g_player_controls_mapping)
+		g.g_host_key_state.inject = lambda idx, down: self.injected.append((g.g_host_key_state.host_keys[idx], down))
+		patcher = mock.patch.object(g, 'g_triggers', True)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		patcher = mock.patch.object(g, 'log_event')
+		self.log_event = patcher.start()
+		self.addCleanup(patcher.stop)
+
+		self.keys = g.ClientKeyTable(['left', 'right', 'x'])
+		self.encoder = g.PacketEncoder()
+
+	def events(self, records, held=None, snap_seq=None):
+		""" """
+		if snap_seq is None:
+			snap_seq = records[-1][0] if records else 0
+		snapshot = None if held is None else (snap_seq, held)
+		return bytes(self.encoder.events(self.keys.table_id, [], records, snapshot))
+
+	def join(self, sender):
+		""" """
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), sender)
+
+	def warnings(self):
+		""" """
+		return [call for call in self.log_event.call_args_list if call.kwargs.get('level', g.Config.LOG_INFO) >= g.Config.LOG_WARN]
+
+	def test_events_wait_for_key_table(self):
+		""" """
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 2)], held=0b100), self.sender)
+		g.host_handle_packet(self.events([], held=0b100), self.sender)
+		self.assertEqual(self.injected, [])
+		self.assertEqual(len(self.warnings()), 1)
+
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		g.host_handle_packet(self.events([], held=0b100), self.sender)
+		self.assertEqual(self.injected, [('s', True)])
+
+	def test_key_table_changed(self):
+		""" """
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		self.keys = g.ClientKeyTable(['x', 'left'])
+		# ids of the old table must not be applied to the new one
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 0)]), self.sender)
+		self.assertEqual(self.injected, [])
+
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		g.host_handle_packet(self.events([(2, 0, g.Proto.EV_PRESS, 0)]), self.sender)
+		self.assertEqual(self.injected, [('s', True)])
+
+	def test_key_table_replaced_releases_held(self):
+		""" """
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		g.host_handle_packet(self.events([(5, 0, g.Proto.EV_PRESS, 0)]), self.sender) # left -> a
+
+		# restarted client: different table, sequence numbers start over
+		self.keys = g.ClientKeyTable(['x', 'left'])
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		self.assertEqual(self.injected, [('a', True), ('a', False)])
+		self.assertEqual(list(g.g_host_key_state.refs), [0, 0])
+
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 0)], held=0b1), self.sender) # x -> s
+		self.assertEqual(self.injected[2:], [('s', True)])
+		g.host_handle_packet(self.events([], held=0, snap_seq=1), self.sender)
+		self.assertEqual(self.injected[3:], [('s', False)])
+
+	def test_key_table_extended_keeps_held(self):
+		""" """
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		g.host_handle_packet(self.events([(5, 0, g.Proto.EV_PRESS, 0)]), self.sender)
+		self.keys.grow = True
+		self.keys.key_id('up')
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		self.assertEqual(self.injected, [('a', True)])
+		self.assertEqual(g.g_peers[self.sender].last_seq, 5)
+
+	def test_repeated_key_table_keeps_state(self):
+		""" """
+		table = bytes(self.encoder.key_table(self.keys.names))
+		g.host_handle_packet(table, self.sender)
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 0)]), self.sender)
+		key_map = g.g_peers[self.sender].key_map
+		g.host_handle_packet(table, self.sender)
+		self.assertIs(g.g_peers[self.sender].key_map, key_map)
+		self.assertEqual(self.injected, [('a', True)])
+
+	def test_unknown_key_id_reported_once(self):
+		""" """
+		g.host_handle_packet(bytes(self.encoder.key_table(self.keys.names)), self.sender)
+		for _ in range(3):
+			g.host_handle_packet(self.events([], held=1 << 5), self.sender)
+		errors = [call for call in self.log_event.call_args_list if call.kwargs.get('level') == g.Config.LOG_ERROR]
+		self.assertEqual(len(errors), 1)
+		self.assertEqual(self.injected, [])
+
+
+	def test_shared_key_released_by_last_holder(self):
+		""" """
+		self.join(self.sender)
+		self.join(self.other)
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 0)]), self.sender) # left -> a
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 1)]), self.other) # right -> a
+		self.assertEqual(self.injected, [('a', True)])
+		self.assertEqual(list(g.g_host_key_state.refs), [0, 2])
+
+		g.host_handle_packet(self.events([(2, 0, g.Proto.EV_RELEASE, 0)]), self.sender)
+		self.assertEqual(self.injected, [('a', True)])
+		g.host_handle_packet(self.events([(2, 0, g.Proto.EV_RELEASE, 1)]), self.other)
+		self.assertEqual(self.injected, [('a', True), ('a', False)])
+		self.assertEqual((list(g.g_host_key_state.refs), g.g_host_key_state.held), ([0, 0], 0))
+
+	def test_release_all(self):
+		""" """
+		state = g.g_host_key_state
+		for idx in (0, 1, 1):
+			state.acquire(idx)
+		state.release_all()
+		self.assertEqual(sorted(self.injected), [('a', False), ('s', False)])
+		self.assertEqual((list(state.refs), state.held), ([0, 0], 0))
+		state.release_all()
+		self.assertEqual(len(self.injected), 2)
+
+	def test_triggers_off_releases(self):
+		""" """
+		self.join(self.sender)
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 0), (2, 0, g.Proto.EV_PRESS, 2)]), self.sender)
+		self.assertEqual(self.injected, [('a', True), ('s', True)])
+
+		with mock.patch.object(g, 'g_triggers', False):
+			g.host_release_all()
+			self.assertEqual(sorted(self.injected[2:]), [('a', False), ('s', False)])
+			self.assertEqual(g.g_peers[self.sender].held, 0)
+			# presses are dropped while triggers are off
+			g.host_handle_packet(self.events([(3, 0, g.Proto.EV_PRESS, 0)], held=0b1), self.sender)
+		self.assertEqual(len(self.injected), 4)
+		self.assertEqual(list(g.g_host_key_state.refs), [0, 0])
+
+
+	def test_snapshot_diff(self):
+		""" """
+		self.join(self.sender)
+		g.host_handle_packet(self.events([], held=0b001), self.sender) # left
+		g.host_handle_packet(self.events([], held=0b001, snap_seq=1), self.sender)
+		g.host_handle_packet(self.events([], held=0b100, snap_seq=2), self.sender) # x
+		self.assertEqual(self.injected, [('a', True), ('a', False), ('s', True)])
+		self.assertEqual(g.g_peers[self.sender].held, 0b100)
+
+	def test_stale_snapshot_ignored(self):
+		""" """
+		self.join(self.sender)
+		g.host_handle_packet(self.events([(4, 0, g.Proto.EV_PRESS, 0)], held=0b001), self.sender)
+		# reordered packet: snapshot taken before #4 still shows nothing held
+		g.host_handle_packet(self.events([], held=0, snap_seq=3), self.sender)
+		self.assertEqual(self.injected, [('a', True)])
+		self.assertEqual(g.g_peers[self.sender].held, 0b001)
+
+	def test_release_stale_peers(self):
+		""" """
+		self.join(self.sender)
+		self.join(self.other)
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 2)]), self.sender) # x -> s
+		g.host_handle_packet(self.events([(1, 0, g.Proto.EV_PRESS, 1)]), self.other) # right -> a
+		g.g_peers[self.sender].last_seen -= g.Config.PEER_TIMEOUT + 1
+		g.host_release_stale_peers()
+		self.assertEqual(self.injected, [('s', True), ('a', True), ('s', False)])
+		self.assertEqual((g.g_peers[self.sender].held, g.g_peers[self.other].held), (0, 0b010))
+
+		g.host_release_stale_peers()
+		self.assertEqual(len(self.injected), 3)
+		self.assertEqual(len(self.warnings()), 1)
+
+
+class TestClientSender(unittest.TestCase):
+	def setUp(self):
+		""" """
+		patcher = mock.patch.object(g, 'log_event')
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_key_table_resent(self):
+		""" """
+		sock = FakeSocket()
+		sender = g.ClientSender(sock, ('host', 1), g.ClientKeyTable(['x']))
+		with mock.patch.object(g.time, 'monotonic', side_effect=[0.0, 0.1, g.Config.SNAPSHOT_INTERVAL + 0.1, g.Config.SNAPSHOT_INTERVAL + 0.1]):
+			for _ in range(3):
+				sender.flush(force_snapshot=True)
+		types = [g.decode_packet(packet)[0] for packet in sock.sent]
+		T, E = g.Proto.PKT_KEY_TABLE, g.Proto.PKT_EVENTS
+		self.assertEqual(types, [T, E, E, T, E])
+
+
+class TestShmRing(unittest.TestCase):
+	def test_put_publish_drain(self):
+		""" """
+		ring = g.ShmRing(8, 2)
+		self.addCleanup(ring.close)
+		self.assertTrue(ring.put(b'ab'))
+		self.assertTrue(ring.put(b'c', b'de'))
+		self.assertFalse(ring.put(b'f')) # full
+		self.assertEqual(ring.drain(), []) # nothing published yet
+		ring.publish()
+		self.assertEqual(ring.get_batch(timeout=1), [b'ab', b'cde'])
+		self.assertEqual(ring.get_batch(timeout=0.01), [])
+
+		# slots are reused once read
+		for round_ in range(3):
+			records = [bytes([round_]) * 8, b'']
+			for record in records:
+				self.assertTrue(ring.put(record))
+			ring.publish()
+			self.assertEqual(ring.get_batch(timeout=1), records)
+
+
+class TestShardDispatcher(unittest.TestCase):
+	sender, other = TestHostPackets.sender, TestHostPackets.other
+	setUp = TestHostPackets.setUp
+	events = TestHostPackets.events
+	warnings = TestHostPackets.warnings
+
+	def until(self, condition, timeout=2.0):
+		""" """
+		deadline = time.monotonic() + timeout
+		while not condition():
+			self.assertLess(time.monotonic(), deadline, 'timed out')
+			time.sleep(0.01)
+
+	def test_round_trip(self):
+		""" Packets go through the worker processes and come back as host
+			key transitions, reference counted across shards by the injector """
+		dispatcher = g.ShardDispatcher(2)
+		dispatcher.start()
+		injector = threading.Thread(target=g.host_inject_thread_func, args=(dispatcher,))
+		injector.start()
+		try:
+			# bad magic: no player slot taken
+			dispatcher.put(b'XX' + self.events([(1, 0, g.Proto.EV_PRESS, 0)])[2:], ('10.0.0.4', 5000))
+			table = bytes(self.encoder.key_table(self.keys.names))
+			for sender, key_id in ((self.sender, 0), (self.other, 1)): # left, right -> a
+				dispatcher.put(table, sender)
+				dispatcher.put(self.events([(1, 0, g.Proto.EV_PRESS, key_id)]), sender)
+			dispatcher.flush()
+			self.until(lambda: list(g.g_host_key_state.refs) == [0, 2])
+			self.assertEqual(self.injected, [('a', True)])
+			self.assertEqual(g.g_addr_player_mapping, {self.sender: 0, self.other: 1})
+
+			dispatcher.put(bytes(self.encoder.disconnect()), self.sender)
+			dispatcher.flush()
+			self.until(lambda: list(g.g_host_key_state.refs) == [0, 1])
+			self.assertEqual(self.injected, [('a', True)])
+		finally:
+			dispatcher.stop()
+			injector.join()
+			dispatcher.close()
+		# workers release everything still held before they exit
+		self.assertEqual(self.injected, [('a', True), ('a', False)])
+		self.assertEqual(list(g.g_host_key_state.refs), [0, 0])
+
+	def test_dead_shard(self):
+		""" """
+		with mock.patch.object(g.ShardDispatcher, 'INBOX_SLOTS', 2):
+			dispatcher = g.ShardDispatcher(1)
+		dispatcher.start()
+		dispatcher.workers[0].terminate()
+		dispatcher.workers[0].join()
+		self.addCleanup(dispatcher.close)
+
+		packet = bytes(self.encoder.key_table(self.keys.names))
+		for _ in range(4):
+			dispatcher.put(packet, self.sender)
+		dispatcher.stop() # must not wait for the dead shard forever
+		self.assertEqual(dispatcher.dropped, 2)
+		errors = [call for call in self.log_event.call_args_list if call.kwargs.get('level') == g.Config.LOG_ERROR]
+		self.assertEqual(len(errors), 1)
+		self.assertEqual(self.warnings(), errors)
+
+
+class TestAsyncLoopback(unittest.TestCase):
+	setUp = TestHostPackets.setUp
+
+	async def until(self, condition, timeout=1.0):
+		""" """
+		for _ in range(int(timeout / 0.01)):
+			if condition():
+				return
+			await asyncio.sleep(0.01)
+		self.fail('timed out')
+
+	def test_round_trip(self):
+		""" Async host and client over loopback: client timers flush events
+			and idle snapshots, trigger_exit() shuts both loops down """
+		with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+			sock.bind(('127.0.0.1', 0))
+			port = sock.getsockname()[1]
+
+		async def no_input():
+			await asyncio.get_running_loop().create_future()
+
+		async def run():
+			host = asyncio.ensure_future(g.async_host_main('127.0.0.1', port))
+			await asyncio.sleep(0.05)
+			host_emit = g.g_emit
+			client = asyncio.ensure_future(g.async_client_main('127.0.0.1', port))
+			await asyncio.sleep(0.05)
+			self.assertIsNot(g.g_emit, host_emit)
+
+			g.g_held_keys = frozenset(['x'])
+			g.g_emit(g.new_event(g.Config.EVENT_KEYPRESS, 'x'))
+			await self.until(lambda: self.injected == [('s', True)])
+
+			# idle client keeps sending snapshots
+			peer, = g.g_peers.values()
+			last_seen = peer.last_seen
+			await self.until(lambda: peer.last_seen > last_seen)
+
+			# disconnect on exit releases what the client still holds
+			g.trigger_exit()
+			await asyncio.wait_for(client, 1)
+			await self.until(lambda: self.injected == [('s', True), ('s', False)])
+			self.assertEqual(g.g_peers, {})
+
+			host_emit(g.Config.QUEUE_CLOSED)
+			await asyncio.wait_for(host, 1)
+			self.assertEqual(asyncio.all_tasks(), {asyncio.current_task()})
+
+		with mock.patch.object(g, 'async_input_task', no_input), \
+		     mock.patch.object(g, 'g_emit'), mock.patch.object(g, 'g_running', True), \
+		     mock.patch.object(g, 'g_tracking', True), mock.patch.object(g, 'g_held_keys', frozenset()), \
+		     mock.patch.object(g, 'g_kind', g.Config.CLIENT), \
+		     mock.patch.object(g.Config, 'SNAPSHOT_INTERVAL', 0.05), mock.patch.object(g.Config, 'BATCH_WINDOW', 0.01):
+			asyncio.run(run())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -198,7 +198,7 @@ version = '0.13.5'
 import re as _re
 import itertools as _itertools
 import collections as _collections
-from threading import Thread as _Thread, Lock as _Lock
+from threading import Thread as _Thread, Lock as _Lock, Condition as _Condition
 import time as _time
 # Python2... Buggy on time changes and leap seconds, but no other good option (https://stackoverflow.com/questions/1205722/how-do-i-get-monotonic-time-durations-in-python).
 _time.monotonic = getattr(_time, 'monotonic', None) or _time.time
@@ -231,24 +231,83 @@ class _Event(_UninterruptibleEvent):
             if _UninterruptibleEvent.wait(self, 0.5):
                 break
 
-import platform as _platform
-if _platform.system() == 'Windows':
-    from. import _winkeyboard as _os_keyboard
-elif _platform.system() == 'Linux':
-    from. import _nixkeyboard as _os_keyboard
-elif _platform.system() == 'Darwin':
-    try:
-        from. import _darwinkeyboard as _os_keyboard
-    except ImportError:
-        # This can happen during setup if pyobj wasn't already installed
-        pass
+import sys as _sys
+
+class _LazyModule(object):
+    """
+    Stands in for a submodule, importing it on first attribute access.
+    Attribute assignments are forwarded, so the real module can still be
+    patched through the proxy.
+    """
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        module = object.__getattribute__(self, '_module')
+        if module is None:
+            import importlib
+            module = importlib.import_module(object.__getattribute__(self, '_name'), __name__)
+            object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+# The backend is only imported once it's actually used, since it pulls in
+# ctypes, subprocess and platform tables that most imports never need.
+if _sys.platform == 'win32':
+    _os_keyboard = _LazyModule('._winkeyboard')
+elif _sys.platform.startswith('linux'):
+    _os_keyboard = _LazyModule('._nixkeyboard')
+elif _sys.platform == 'darwin':
+    _os_keyboard = _LazyModule('._darwinkeyboard')
 else:
-    raise OSError("Unsupported platform '{}'".format(_platform.system()))
+    raise OSError("Unsupported platform '{}'".format(_sys.platform))
 
 from ._keyboard_event import KEY_DOWN, KEY_UP, KeyboardEvent
 from ._generic import GenericListener as _GenericListener
+from . import _canonical_names
 from ._canonical_names import all_modifiers, sided_modifiers, normalize_name
 
+class _LRUCache(object):
+    """
+    Thread-safe mapping holding at most `max_size` entries, evicting the least
+    recently read. Unhashable keys raise TypeError, like a dict.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = _Lock()
+        self.entries = _collections.OrderedDict()
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
 _modifier_scan_codes = set()
 def is_modifier(key):
     """
@@ -262,8 +321,46 @@ def is_modifier(key):
             _modifier_scan_codes.update(*scan_codes)
         return key in _modifier_scan_codes
 
+class _PressedEvents(dict):
+    """
+    Last event per pressed scan code. Also keeps `scan_codes`, a frozenset of
+    the keys, updated only when a key is added or removed, so hotkey lookups
+    don't need to sort and copy the keys on every event.
+    """
+    scan_codes = frozenset()
+
+    def __setitem__(self, scan_code, event):
+        if scan_code not in self:
+            self.scan_codes = self.scan_codes | frozenset((scan_code,))
+        dict.__setitem__(self, scan_code, event)
+
+    def __delitem__(self, scan_code):
+        dict.__delitem__(self, scan_code)
+        self.scan_codes = self.scan_codes - frozenset((scan_code,))
+
+    def pop(self, scan_code, *default):
+        if scan_code in self:
+            self.scan_codes = self.scan_codes - frozenset((scan_code,))
+        return dict.pop(self, scan_code, *default)
+
+    def clear(self):
+        dict.clear(self)
+        self.scan_codes = frozenset()
+
+class _HotkeyTable(dict):
+    """
+    Handlers per combination of pressed scan codes, keyed by frozenset. Any
+    other iterable of scan codes is also accepted as key, and missing entries
+    are created empty, like a defaultdict(list).
+    """
+    def __missing__(self, scan_codes):
+        if not isinstance(scan_codes, frozenset):
+            return self[frozenset(scan_codes)]
+        handlers = self[scan_codes] = []
+        return handlers
+
 _pressed_events_lock = _Lock()
-_pressed_events = {}
+_pressed_events = _PressedEvents()
 _physically_pressed_keys = _pressed_events
 _logically_pressed_keys = {}
 class _KeyboardListener(_GenericListener):
@@ -317,8 +414,8 @@ class _KeyboardListener(_GenericListener):
         self.blocking_hooks = []
         self.blocking_keys = _collections.defaultdict(list)
         self.nonblocking_keys = _collections.defaultdict(list)
-        self.blocking_hotkeys = _collections.defaultdict(list)
-        self.nonblocking_hotkeys = _collections.defaultdict(list)
+        self.blocking_hotkeys = _HotkeyTable()
+        self.nonblocking_hotkeys = _HotkeyTable()
         self.filtered_modifiers = _collections.Counter()
         self.is_replaying = False
 
@@ -330,9 +427,7 @@ class _KeyboardListener(_GenericListener):
         for key_hook in self.nonblocking_keys[event.scan_code]:
             key_hook(event)
 
-        with _pressed_events_lock:
-            hotkey = tuple(sorted(_pressed_events))
-        for callback in self.nonblocking_hotkeys[hotkey]:
+        for callback in self.nonblocking_hotkeys.get(_pressed_events.scan_codes, ()):
             callback(event)
 
         return event.scan_code or (event.name and event.name != 'unknown')
@@ -362,7 +457,7 @@ class _KeyboardListener(_GenericListener):
             if event_type == KEY_DOWN:
                 if is_modifier(scan_code): self.active_modifiers.add(scan_code)
                 _pressed_events[scan_code] = event
-            hotkey = tuple(sorted(_pressed_events))
+            hotkey = _pressed_events.scan_codes
             if event_type == KEY_UP:
                 self.active_modifiers.discard(scan_code)
                 if scan_code in _pressed_events: del _pressed_events[scan_code]
@@ -383,7 +478,7 @@ class _KeyboardListener(_GenericListener):
                 modifiers_to_update = self.active_modifiers
                 if is_modifier(scan_code):
                     modifiers_to_update = modifiers_to_update | {scan_code}
-                callback_results = [callback(event) for callback in self.blocking_hotkeys[hotkey]]
+                callback_results = [callback(event) for callback in self.blocking_hotkeys.get(hotkey, ())]
                 if callback_results:
                     accept = all(callback_results)
                     origin = 'hotkey'
@@ -413,6 +508,10 @@ class _KeyboardListener(_GenericListener):
 
 _listener = _KeyboardListener()
 
+# Memoized scan codes per key name, for successful lookups only: failures
+# may be transient (e.g. dumpkeys not readable yet). Cleared with the other
+# caches in `_clear_key_caches` when the OS tables change.
+_scan_codes_by_name = _LRUCache(1024)
 def key_to_scan_codes(key, error_if_missing=True):
     """
     Returns a list of scan codes associated with this key (name or scan code).
@@ -424,24 +523,41 @@ def key_to_scan_codes(key, error_if_missing=True):
     elif not _is_str(key):
         raise ValueError('Unexpected key type ' + str(type(key)) + ', value (' + repr(key) + ')')
 
+    try:
+        t, e = _scan_codes_by_name[key], None
+    except KeyError:
+        t, e = _lookup_scan_codes(key)
+        if t and e is None:
+            _scan_codes_by_name[key] = t
+
+    if not t and error_if_missing:
+        raise ValueError('Key {} is not mapped to any known key.'.format(repr(key)), e)
+    else:
+        return t
+
+def _lookup_scan_codes(key):
     normalized = normalize_name(key)
     if normalized in sided_modifiers:
         left_scan_codes = key_to_scan_codes('left ' + normalized, False)
         right_scan_codes = key_to_scan_codes('right ' + normalized, False)
-        return left_scan_codes + tuple(c for c in right_scan_codes if c not in left_scan_codes)
+        return left_scan_codes + tuple(c for c in right_scan_codes if c not in left_scan_codes), None
 
     try:
         # Put items in ordered dict to remove duplicates.
-        t = tuple(_collections.OrderedDict((scan_code, True) for scan_code, modifier in _os_keyboard.map_name(normalized)))
-        e = None
+        return tuple(_collections.OrderedDict((scan_code, True) for scan_code, modifier in _os_keyboard.map_name(normalized))), None
     except (KeyError, ValueError) as exception:
-        t = ()
-        e = exception
+        return (), exception
 
-    if not t and error_if_missing:
-        raise ValueError('Key {} is not mapped to any known key.'.format(repr(key)), e)
-    else:
-        return t
+def _clear_key_caches():
+    """
+    Forgets all memoized name and hotkey lookups. Registered with
+    `_canonical_names.on_tables_changed`, so backends trigger it whenever they
+    (re)build their key tables.
+    """
+    _scan_codes_by_name.clear()
+    _compiled_hotkeys.clear()
+    _modifier_scan_codes.clear()
+_canonical_names.on_tables_changed(_clear_key_caches)
 
 def parse_hotkey(hotkey):
     """
@@ -476,6 +592,41 @@ def parse_hotkey(hotkey):
         steps.append(tuple(key_to_scan_codes(key) for key in keys))
     return tuple(steps)
 
+_compiled_hotkeys = _LRUCache(512)
+def _compile_hotkey(hotkey):
+    """
+    Returns the scan codes `send` uses for each step of `hotkey`, e.g.
+    ((ctrl, alt, del),) for 'ctrl+alt+del', as immutable nested tuples.
+
+    Results for hashable hotkeys are kept in a small LRU cache, so repeatedly
+    sending the same hotkey doesn't parse it again.
+    """
+    try:
+        return _compiled_hotkeys[hotkey]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable, e.g. list of keys. Not worth caching.
+        return tuple(tuple(scan_codes[0] for scan_codes in step) for step in parse_hotkey(hotkey))
+
+    plan = tuple(tuple(scan_codes[0] for scan_codes in step) for step in parse_hotkey(hotkey))
+    _compiled_hotkeys[hotkey] = plan
+    return plan
+
+def _send_events(events):
+    """
+    Sends a list of `(scan_code, is_down)` pairs to the OS as one batch (a
+    single device write on Linux). Events are marked as replayed, so they are
+    not processed as user input.
+    """
+    if not events:
+        return
+    _listener.is_replaying = True
+    try:
+        _os_keyboard.send_events(events)
+    finally:
+        _listener.is_replaying = False
+
 def send(hotkey, do_press=True, do_release=True):
     """
     Sends OS events that perform the given *hotkey* hotkey.
@@ -492,19 +643,56 @@ def send(hotkey, do_press=True, do_release=True):
 
     Note: keys are released in the opposite order they were pressed.
     """
-    _listener.is_replaying = True
-
-    parsed = parse_hotkey(hotkey)
-    for step in parsed:
+    events = []
+    for step in _compile_hotkey(hotkey):
         if do_press:
-            for scan_codes in step:
-                _os_keyboard.press(scan_codes[0])
-
+            events.extend((scan_code, True) for scan_code in step)
         if do_release:
-            for scan_codes in reversed(step):
-                _os_keyboard.release(scan_codes[0])
+            events.extend((scan_code, False) for scan_code in reversed(step))
+    _send_events(events)
+
+def send_scan_codes(scan_codes, down=True):
+    """
+    Presses (or releases, if `down` is false) each of the given scan codes, in
+    the given order. No parsing or name lookup is done, making this the
+    cheapest way to inject keys when the scan codes are already known (e.g.
+    from `key_to_scan_codes`).
 
-    _listener.is_replaying = False
+        codes = [key_to_scan_codes(k)[0] for k in ('ctrl', 'c')]
+        send_scan_codes(codes, True)
+        send_scan_codes(reversed(codes), False)
+
+    Note: unlike `release`, scan codes are released in the order given.
+    """
+    _send_events([(scan_code, down) for scan_code in scan_codes])
+
+def listen_only_to(keys=None, grab=False):
+    """
+    Restricts the listener to input devices that can emit at least one of the
+    given keys (names, scan codes or hotkeys), skipping mice, touchpads and
+    other unrelated devices. With `grab=True` those devices are taken
+    exclusively, so other programs stop seeing any of their events, not only
+    those of the given keys; a device that can't be grabbed (e.g. already
+    grabbed elsewhere) is read without it, with a warning. Pass `keys=None`
+    to listen to all keyboards again.
+
+    Only supported on Linux, where it must be called before the first hook is
+    added; returns False on other platforms.
+    """
+    if not hasattr(_os_keyboard, 'set_device_filter'):
+        return False
+
+    scan_codes = None
+    if keys is not None:
+        if _is_str(keys) or _is_number(keys):
+            keys = [keys]
+        scan_codes = set()
+        for key in keys:
+            for step in parse_hotkey(key):
+                for codes in step:
+                    scan_codes.update(codes)
+    _os_keyboard.set_device_filter(scan_codes, grab)
+    return True
 
 # Alias.
 press_and_release = send
@@ -536,9 +724,7 @@ def is_pressed(hotkey):
     if len(steps) > 1:
         raise ValueError("Impossible to check if multi-step hotkeys are pressed (`a+b` is ok, `a, b` isn't).")
 
-    # Convert _pressed_events into a set 
-    with _pressed_events_lock:
-        pressed_scan_codes = set(_pressed_events)
+    pressed_scan_codes = _pressed_events.scan_codes
     for scan_codes in steps[0]:
         if not any(scan_code in pressed_scan_codes for scan_code in scan_codes):
             return False
@@ -703,16 +889,157 @@ def _add_hotkey_step(handler, combinations, suppress):
         for scan_code in scan_codes:
             if is_modifier(scan_code):
                 _listener.filtered_modifiers[scan_code] += 1
-        container[scan_codes].append(handler)
+        container[frozenset(scan_codes)].append(handler)
 
     def remove():
         for scan_codes in combinations:
             for scan_code in scan_codes:
                 if is_modifier(scan_code):
                     _listener.filtered_modifiers[scan_code] -= 1
-            container[scan_codes].remove(handler)
+            container[frozenset(scan_codes)].remove(handler)
     return remove
 
+class _SequenceNode(object):
+    """ Trie node: the steps of multi-step hotkeys matched so far. """
+    def __init__(self):
+        # Combination of scan codes of the next step -> node after it.
+        self.children = {}
+        # Callbacks of the hotkeys that end here.
+        self.callbacks = []
+        # Every scan code used by the next steps; others abort the sequence.
+        self.allowed_keys = set()
+
+class _HotkeySequences(object):
+    """
+    All multi-step hotkeys with the same `suppress`, trigger and `timeout`
+    settings, compiled into one trie over step combinations. Only the
+    combinations that can follow the current node are registered as hotkey
+    steps, and a single `catch_misses` hook is installed while a sequence is
+    in progress, so the cost per event doesn't grow with the number of
+    hotkeys.
+    """
+    def __init__(self, suppress, event_type, timeout):
+        self.suppress = suppress
+        self.event_type = event_type
+        self.timeout = timeout
+        self.root = self.node = _SequenceNode()
+        self.suppressed_events = []
+        self.last_update = float('-inf')
+        self.remove_step = lambda: None
+        self.remove_catch_misses = None
+
+    def add(self, steps, callback):
+        """ Adds a hotkey, returning the function that removes it. """
+        ends = []
+        def insert(node, steps):
+            if not steps:
+                node.callbacks.append(callback)
+                ends.append(node)
+                return
+            for scan_codes in steps[0]:
+                scan_codes = frozenset(scan_codes)
+                node.allowed_keys.update(scan_codes)
+                if scan_codes not in node.children:
+                    node.children[scan_codes] = _SequenceNode()
+                insert(node.children[scan_codes], steps[1:])
+        insert(self.root, steps)
+        # Sequences in progress are dropped, as their next steps changed.
+        self.set_node(self.root)
+
+        def remove():
+            for node in ends:
+                node.callbacks.remove(callback)
+            self.prune(self.root)
+            if self.root.children:
+                self.set_node(self.root)
+            else:
+                self.detach()
+        return remove
+
+    def prune(self, node):
+        for scan_codes, child in list(node.children.items()):
+            self.prune(child)
+            if not child.children and not child.callbacks:
+                del node.children[scan_codes]
+        node.allowed_keys = set().union(*node.children)
+
+    def detach(self):
+        """ Unregisters every step and hook, e.g. when no hotkeys are left. """
+        self.remove_step()
+        self.remove_step = lambda: None
+        if self.remove_catch_misses:
+            try:
+                self.remove_catch_misses()
+            except ValueError:
+                # Already removed by `unhook_all`.
+                pass
+            self.remove_catch_misses = None
+        self.node = self.root
+
+    def set_node(self, node):
+        self.remove_step()
+        self.node = node
+
+        if node is self.root:
+            # No global hook while idle, for performance reasons.
+            if self.remove_catch_misses:
+                self.remove_catch_misses()
+                self.remove_catch_misses = None
+        elif not self.remove_catch_misses:
+            # Must be `suppress=True` to ensure `send` has priority.
+            self.remove_catch_misses = hook(self.catch_misses, suppress=True)
+
+        removers = [_add_hotkey_step(self.step_handler(child), (scan_codes,), self.suppress) for scan_codes, child in node.children.items()]
+        def remove_step():
+            for remove in removers:
+                remove()
+            self.remove_step = lambda: None
+        self.remove_step = remove_step
+        self.last_update = _time.monotonic()
+
+    def step_handler(self, child):
+        def handler(event):
+            if not child.callbacks:
+                if event.event_type == KEY_UP:
+                    self.set_node(child)
+                self.suppressed_events.append(event)
+                return False
+
+            if event.event_type == KEY_UP:
+                self.set_node(child if child.children else self.root)
+            if event.event_type == self.event_type:
+                accept = all([callback() for callback in child.callbacks])
+                if accept:
+                    return self.catch_misses(event, force_fail=True)
+            self.suppressed_events[:] = [event]
+            return False
+        return handler
+
+    def catch_misses(self, event, force_fail=False):
+        if (
+                event.event_type == self.event_type
+                and self.node is not self.root
+                and event.scan_code not in self.node.allowed_keys
+            ) or (
+                self.timeout
+                and _time.monotonic() - self.last_update >= self.timeout
+            ) or force_fail: # Weird formatting to ensure short-circuit.
+
+            self.remove_step()
+
+            for event in self.suppressed_events:
+                if event.event_type == KEY_DOWN:
+                    press(event.scan_code)
+                else:
+                    release(event.scan_code)
+            del self.suppressed_events[:]
+
+            self.set_node(self.root)
+        return True
+
+# (suppress, event_type, timeout) -> _HotkeySequences
+_hotkey_sequences = {}
+
 _hotkeys = {}
 def add_hotkey(hotkey, callback, args=(), suppress=False, timeout=1, trigger_on_release=False):
     """
@@ -776,82 +1103,13 @@ def add_hotkey(hotkey, callback, args=(), suppress=False, timeout=1, trigger_on_
         _hotkeys[hotkey] = _hotkeys[remove_] = _hotkeys[callback] = remove_
         return remove_
 
-    state = _State()
-    state.remove_catch_misses = lambda: None
-    state.remove_last_step = None
-    state.suppressed_events = []
-    state.last_update = float('-inf')
-    
-    def catch_misses(event, force_fail=False):
-        if (
-                event.event_type == event_type
-                and state.index
-                and event.scan_code not in allowed_keys_by_step[state.index]
-            ) or (
-                timeout
-                and _time.monotonic() - state.last_update >= timeout
-            ) or force_fail: # Weird formatting to ensure short-circuit.
-
-            state.remove_last_step()
-
-            for event in state.suppressed_events:
-                if event.event_type == KEY_DOWN:
-                    press(event.scan_code)
-                else:
-                    release(event.scan_code)
-            del state.suppressed_events[:]
-
-            index = 0
-            set_index(0)
-        return True
-
-    def set_index(new_index):
-        state.index = new_index
-
-        if new_index == 0:
-            # This is done for performance reasons, avoiding a global key hook
-            # that is always on.
-            state.remove_catch_misses()
-            state.remove_catch_misses = lambda: None
-        elif new_index == 1:
-            state.remove_catch_misses()
-            # Must be `suppress=True` to ensure `send` has priority.
-            state.remove_catch_misses = hook(catch_misses, suppress=True)
-
-        if new_index == len(steps) - 1:
-            def handler(event):
-                if event.event_type == KEY_UP:
-                    remove()
-                    set_index(0)
-                accept = event.event_type == event_type and callback() 
-                if accept:
-                    return catch_misses(event, force_fail=True)
-                else:
-                    state.suppressed_events[:] = [event]
-                    return False
-            remove = _add_hotkey_step(handler, steps[state.index], suppress)
-        else:
-            # Fix value of next_index.
-            def handler(event, new_index=state.index+1):
-                if event.event_type == KEY_UP:
-                    remove()
-                    set_index(new_index)
-                state.suppressed_events.append(event)
-                return False
-            remove = _add_hotkey_step(handler, steps[state.index], suppress)
-        state.remove_last_step = remove
-        state.last_update = _time.monotonic()
-        return False
-    set_index(0)
-
-    allowed_keys_by_step = [
-        set().union(*step)
-        for step in steps
-    ]
+    key = (suppress, event_type, timeout)
+    if key not in _hotkey_sequences:
+        _hotkey_sequences[key] = _HotkeySequences(suppress, event_type, timeout)
+    remove_sequence = _hotkey_sequences[key].add(steps, callback)
 
     def remove_():
-        state.remove_catch_misses()
-        state.remove_last_step()
+        remove_sequence()
         _hotkeys.pop(hotkey, None)
         _hotkeys.pop(remove_, None)
         _hotkeys.pop(callback, None)
@@ -876,6 +1134,9 @@ def unhook_all_hotkeys():
     """
     # Because of "alises" some hooks may have more than one entry, all of which
     # are removed together.
+    for sequences in _hotkey_sequences.values():
+        sequences.detach()
+    _hotkey_sequences.clear()
     _listener.blocking_hotkeys.clear()
     _listener.nonblocking_hotkeys.clear()
 unregister_all_hotkeys = remove_all_hotkeys = clear_all_hotkeys = unhook_all_hotkeys
@@ -908,8 +1169,7 @@ def stash_state():
     # TODO: stash caps lock / numlock /scrollock state.
     with _pressed_events_lock:
         state = sorted(_pressed_events)
-    for scan_code in state:
-        _os_keyboard.release(scan_code)
+    _os_keyboard.send_events([(scan_code, False) for scan_code in state])
     return state
 
 def restore_state(scan_codes):
@@ -917,17 +1177,10 @@ def restore_state(scan_codes):
     Given a list of scan_codes ensures these keys, and only these keys, are
     pressed. Pairs well with `stash_state`, alternative to `restore_modifiers`.
     """
-    _listener.is_replaying = True
-
     with _pressed_events_lock:
         current = set(_pressed_events)
     target = set(scan_codes)
-    for scan_code in current - target:
-        _os_keyboard.release(scan_code)
-    for scan_code in target - current:
-        _os_keyboard.press(scan_code)
-
-    _listener.is_replaying = False
+    _send_events([(scan_code, False) for scan_code in current - target] + [(scan_code, True) for scan_code in target - current])
 
 def restore_modifiers(scan_codes):
     """
@@ -954,7 +1207,7 @@ def write(text, delay=0, restore_state_after=True, exact=None):
     value.
     """
     if exact is None:
-        exact = _platform.system() == 'Windows'
+        exact = _sys.platform == 'win32'
 
     state = stash_state()
     
@@ -967,25 +1220,29 @@ def write(text, delay=0, restore_state_after=True, exact=None):
                 _os_keyboard.type_unicode(letter)
             if delay: _time.sleep(delay)
     else:
+        # Without a delay, consecutive letters are sent as a single batch.
+        events = []
         for letter in text:
             try:
                 entries = _os_keyboard.map_name(normalize_name(letter))
                 scan_code, modifiers = next(iter(entries))
             except (KeyError, ValueError, StopIteration):
+                _send_events(events)
+                del events[:]
                 _os_keyboard.type_unicode(letter)
                 continue
-            
-            for modifier in modifiers:
-                press(modifier)
 
-            _os_keyboard.press(scan_code)
-            _os_keyboard.release(scan_code)
-
-            for modifier in modifiers:
-                release(modifier)
+            modifier_codes = [scan_code for modifier in modifiers for step in _compile_hotkey(modifier) for scan_code in step]
+            events.extend((modifier_code, True) for modifier_code in modifier_codes)
+            events.append((scan_code, True))
+            events.append((scan_code, False))
+            events.extend((modifier_code, False) for modifier_code in modifier_codes)
 
             if delay:
+                _send_events(events)
+                del events[:]
                 _time.sleep(delay)
+        _send_events(events)
 
     if restore_state_after:
         restore_modifiers(state)
@@ -1046,6 +1303,110 @@ def read_event(suppress=False):
         unhook(hooked)
         return event
 
+class EventSubscription(object):
+    """
+    Long-lived stream of keyboard events, created by `subscribe`. Events are
+    buffered from the moment it's created until `close` is called, so no
+    event is missed between reads.
+    """
+    def __init__(self, suppress=False, maxsize=4096, overflow='drop_oldest'):
+        if overflow not in ('drop_oldest', 'drop_newest'):
+            raise ValueError('Unknown overflow policy {}, expected "drop_oldest" or "drop_newest".'.format(repr(overflow)))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        # Events discarded because the buffer was full.
+        self.dropped = 0
+        self.closed = False
+        self._events = _collections.deque()
+        self._available = _Condition(_Lock())
+        self._unhook = hook(self._put, suppress=suppress)
+
+    def _put(self, event):
+        with self._available:
+            if self.maxsize and len(self._events) >= self.maxsize:
+                self.dropped += 1
+                if self.overflow == 'drop_newest':
+                    return
+                self._events.popleft()
+            self._events.append(event)
+            self._available.notify()
+
+    def _wait(self, timeout):
+        # Must hold `_available`. Returns False if nothing will arrive in time.
+        deadline = None if timeout is None else _time.monotonic() + timeout
+        while not self._events and not self.closed:
+            remaining = 0.5 if deadline is None else deadline - _time.monotonic()
+            if remaining <= 0:
+                break
+            # Short waits, so Ctrl+C is not ignored (see `_Event`).
+            self._available.wait(min(remaining, 0.5))
+        return bool(self._events)
+
+    def get(self, timeout=None):
+        """
+        Removes and returns the oldest event, blocking up to `timeout` seconds
+        (forever if None). Returns None on timeout or once closed and empty.
+        """
+        with self._available:
+            if not self._wait(timeout):
+                return None
+            return self._events.popleft()
+
+    def get_batch(self, max_events=None, timeout=None):
+        """
+        Like `get`, but removes and returns all buffered events (at most
+        `max_events`) as a list, which is empty on timeout or once closed.
+        """
+        with self._available:
+            if not self._wait(timeout):
+                return []
+            if max_events is None or max_events >= len(self._events):
+                batch = list(self._events)
+                self._events.clear()
+            else:
+                batch = [self._events.popleft() for i in range(max_events)]
+            return batch
+
+    def __iter__(self):
+        """ Yields events as they arrive, until closed. """
+        while True:
+            event = self.get()
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        """
+        Stops receiving events and wakes blocked readers. Events already
+        buffered can still be read.
+        """
+        with self._available:
+            if self.closed:
+                return
+            self.closed = True
+            self._available.notify_all()
+        self._unhook()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def subscribe(suppress=False, maxsize=4096, overflow='drop_oldest'):
+    """
+    Returns an `EventSubscription` receiving every keyboard event until
+    closed. Unlike calling `read_event` in a loop, the hook is installed once
+    and events arriving between reads are buffered, up to `maxsize` (0 for
+    unbounded). When full, `overflow` decides whether the oldest
+    ('drop_oldest') or the incoming ('drop_newest') event is discarded.
+
+        with subscribe() as events:
+            for event in events:
+                print(event.name, event.event_type)
+    """
+    return EventSubscription(suppress, maxsize, overflow)
+
 def read_key(suppress=False):
     """
     Blocks until a keyboard event happens, then returns that event's name or,
@@ -1093,7 +1454,7 @@ def get_typed_strings(events, allow_backspace=True):
 
         get_type_strings(record()) #-> ['This is what', 'I recorded', '']
     """
-    backspace_name = 'delete' if _platform.system() == 'Darwin' else 'backspace'
+    backspace_name = 'delete' if _sys.platform == 'darwin' else 'backspace'
 
     shift_pressed = False
     capslock_pressed = False
@@ -1172,14 +1533,23 @@ def play(events, speed_factor=1.0):
     """
     state = stash_state()
 
+    # Events without a delay between them are sent as a single batch.
+    batch = []
     last_time = None
     for event in events:
-        if speed_factor > 0 and last_time is not None:
+        if speed_factor > 0 and last_time is not None and event.time != last_time:
+            _send_events(batch)
+            del batch[:]
             _time.sleep((event.time - last_time) / speed_factor)
         last_time = event.time
 
-        key = event.scan_code or event.name
-        press(key) if event.event_type == KEY_DOWN else release(key)
+        is_down = event.event_type == KEY_DOWN
+        if event.scan_code:
+            batch.append((event.scan_code, is_down))
+        else:
+            for step in _compile_hotkey(event.name):
+                batch.extend((scan_code, is_down) for scan_code in (step if is_down else reversed(step)))
+    _send_events(batch)
 
     restore_modifiers(state)
 replay = play
@@ -1277,3 +1647,11 @@ def add_abbreviation(source_text, replacement_text, match_suffix=False, timeout=
 register_word_listener = add_word_listener
 register_abbreviation = add_abbreviation
 remove_abbreviation = remove_word_listener
+
+def __getattr__(name):
+    # The asyncio front-end (`aevents`, `await_hotkey`, `asend`) is imported on
+    # first use, as it needs Python 3.7+ and asyncio is slow to import.
+    if name in ('aevents', 'await_hotkey', 'asend'):
+        from . import _asyncio
+        return getattr(_asyncio, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio front-end for the listener (Python 3.7+). Exposed lazily as
+`keyboard.aevents`, `keyboard.await_hotkey` and `keyboard.asend`, so plain
+`import keyboard` doesn't pull in asyncio.
+
+    async def main():
+        async with keyboard.aevents() as events:
+            async for event in events:
+                print(event.name, event.event_type)
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from . import hook, add_hotkey, send
+
+class _LoopBridge(object):
+    """
+    Hook callback that collects events on the listener thread and hands them
+    to `deliver` on the event loop, in batches: at most one
+    `call_soon_threadsafe` is pending at a time, no matter how many events
+    arrive before the loop gets to it.
+    """
+    def __init__(self, loop, deliver):
+        self.loop = loop
+        self.deliver = deliver
+        self.pending = deque()
+        self.scheduled = False
+
+    def __call__(self, event):
+        self.pending.append(event)
+        if not self.scheduled:
+            self.scheduled = True
+            try:
+                self.loop.call_soon_threadsafe(self.flush)
+            except RuntimeError:
+                # Loop already closed.
+                pass
+
+    def flush(self):
+        # Reset before draining, so events appended meanwhile schedule a
+        # new flush instead of being stranded.
+        self.scheduled = False
+        batch = []
+        while self.pending:
+            batch.append(self.pending.popleft())
+        if batch:
+            self.deliver(batch)
+
+# Put by `close` to wake a pending `__anext__`.
+_closed = object()
+
+class AsyncEventStream(object):
+    """
+    Asynchronous iterator over keyboard events, created by `aevents`. The hook
+    is installed on creation, so events are buffered from then on, even
+    before the first iteration. Iteration ends once `close` (or `aclose`) is
+    called, which removes the hook.
+    """
+    def __init__(self, suppress=False):
+        self.closed = False
+        self._queue = asyncio.Queue()
+        self._unhook = hook(_LoopBridge(asyncio.get_running_loop(), self._deliver), suppress=suppress)
+
+    def _deliver(self, batch):
+        if not self.closed:
+            for event in batch:
+                self._queue.put_nowait(event)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+        event = await self._queue.get()
+        if event is _closed:
+            raise StopAsyncIteration
+        return event
+
+    def close(self):
+        """ Removes the hook and ends iteration. """
+        if self.closed:
+            return
+        self.closed = True
+        self._unhook()
+        self._queue.put_nowait(_closed)
+
+    async def aclose(self):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+def aevents(suppress=False):
+    """
+    Returns an asynchronous iterator over all keyboard events, starting now:
+    the hook is installed by this call. Close it (or use `async with`) to
+    remove the hook; breaking out of the loop alone leaves it installed.
+    Must be called with an event loop running.
+
+        async with aevents() as events:
+            async for event in events:
+                ...
+    """
+    return AsyncEventStream(suppress)
+
+async def await_hotkey(hotkey, suppress=False, trigger_on_release=False):
+    """
+    Waits until `hotkey` is pressed (or released, if `trigger_on_release`)
+    without blocking the event loop. See `add_hotkey` for the hotkey format.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    def set_result():
+        if not future.done():
+            future.set_result(None)
+    remove = add_hotkey(hotkey, lambda: loop.call_soon_threadsafe(set_result), suppress=suppress, trigger_on_release=trigger_on_release)
+    try:
+        await future
+    finally:
+        remove()
+
+# A single worker keeps concurrent `asend` calls in submission order.
+_send_executor = None
+_send_executor_lock = Lock()
+
+async def asend(hotkey, do_press=True, do_release=True):
+    """
+    Like `send`, but runs on a background thread so slow backends never
+    stall the event loop.
+    """
+    global _send_executor
+    with _send_executor_lock:
+        if _send_executor is None:
+            _send_executor = ThreadPoolExecutor(max_workers=1)
+    await asyncio.get_running_loop().run_in_executor(_send_executor, send, hotkey, do_press, do_release)
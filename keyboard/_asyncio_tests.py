@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the asyncio front-end (`keyboard._asyncio`). Kept apart from
+`_keyboard_tests` because they use `async def`, which earlier Pythons can't
+even compile, and need Python 3.7+ to run. Events are pumped with the same
+mocked backend and helpers as `_keyboard_tests`.
+"""
+import sys
+import unittest
+
+if sys.version_info < (3, 7):
+    raise unittest.SkipTest('asyncio front-end needs Python 3.7+')
+
+import asyncio
+
+import keyboard
+from . import _keyboard_tests
+from ._keyboard_tests import d_a, du_a
+
+class TestAsyncio(unittest.TestCase):
+    setUp = _keyboard_tests.TestKeyboard.setUp
+    tearDown = _keyboard_tests.TestKeyboard.tearDown
+    do = _keyboard_tests.TestKeyboard.do
+
+    def test_aevents(self):
+        async def read_two():
+            events = keyboard.aevents()
+            first = asyncio.ensure_future(events.__anext__())
+            await asyncio.sleep(0)
+            await asyncio.get_running_loop().run_in_executor(None, self.do, du_a)
+            second = await events.__anext__()
+            await events.aclose()
+            return [await first, second]
+        self.assertEqual(asyncio.run(read_two()), du_a)
+        self.assertEqual(keyboard._listener.handlers, [])
+
+    def test_aevents_buffers_before_iteration(self):
+        async def read_all():
+            async with keyboard.aevents() as events:
+                # Hook is installed by the call, not by the first iteration.
+                self.assertEqual(len(keyboard._listener.handlers), 1)
+                await asyncio.get_running_loop().run_in_executor(None, self.do, du_a)
+                await asyncio.sleep(0.01)
+                received = [await events.__anext__(), await events.__anext__()]
+            # Ends once closed.
+            with self.assertRaises(StopAsyncIteration):
+                await events.__anext__()
+            return received
+        self.assertEqual(asyncio.run(read_all()), du_a)
+        self.assertEqual(keyboard._listener.handlers, [])
+
+    def test_await_hotkey(self):
+        async def wait_hotkey():
+            waiter = asyncio.ensure_future(keyboard.await_hotkey('a'))
+            await asyncio.sleep(0)
+            await asyncio.get_running_loop().run_in_executor(None, self.do, d_a)
+            await asyncio.wait_for(waiter, 1)
+        asyncio.run(wait_hotkey())
+        self.assertEqual(keyboard._hotkeys, {})
+
+    def test_asend(self):
+        asyncio.run(keyboard.asend('a'))
+        self.do([], du_a)
+
+if __name__ == '__main__':
+    unittest.main()
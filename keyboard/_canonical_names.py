@@ -6,10 +6,16 @@ try:
 except NameError:
     basestring = str
 
-import platform
+import sys
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 
-# Defaults to Windows canonical names (platform-specific overrides below)
-canonical_names = {
+# Defaults to Windows canonical names (platform-specific overrides below).
+# The table is large, so it's only built on first use (see `normalize_name`).
+def _build_canonical_names():
+    canonical_names = {
     'escape': 'esc',
     'return': 'enter',
     'del': 'delete',
@@ -1206,41 +1212,103 @@ canonical_names = {
     "zeta": "ζ",
     "Zeta": "Ζ",
     "Zsmall": "",
-}
+    }
+    if sys.platform == 'darwin':
+        canonical_names.update({
+            "command": "command",
+            "windows": "command",
+            "cmd": "command",
+            "win": "command",
+            "backspace": "delete",
+            'alt gr': 'alt' # Issue #117
+        })
+    if sys.platform.startswith('linux'):
+        canonical_names.update({
+            "select": "end",
+            "find": "home",
+            'next': 'page down',
+            'prior': 'page up',
+        })
+    return canonical_names
+
+_canonical_names = None
+def _get_canonical_names():
+    global _canonical_names
+    if _canonical_names is None:
+        _canonical_names = _build_canonical_names()
+    return _canonical_names
+
+class _LazyCanonicalNames(MutableMapping):
+    """ The canonical names table, built on first access. """
+    def __getitem__(self, name):
+        return _get_canonical_names()[name]
+
+    def __setitem__(self, name, canonical):
+        _get_canonical_names()[name] = canonical
+        tables_changed()
+
+    def __delitem__(self, name):
+        del _get_canonical_names()[name]
+        tables_changed()
+
+    def __iter__(self):
+        return iter(_get_canonical_names())
+
+    def __len__(self):
+        return len(_get_canonical_names())
+
+    def __repr__(self):
+        return repr(_get_canonical_names())
+
+canonical_names = _LazyCanonicalNames()
+
 sided_modifiers = {'ctrl', 'alt', 'shift', 'windows'}
 all_modifiers = {'alt', 'alt gr', 'ctrl', 'shift', 'windows'} | set('left ' + n for n in sided_modifiers) | set('right ' + n for n in sided_modifiers)
 
 # Platform-specific canonical overrides
 
-if platform.system() == 'Darwin':
-    canonical_names.update({
-        "command": "command",
-        "windows": "command",
-        "cmd": "command",
-        "win": "command",
-        "backspace": "delete",
-        'alt gr': 'alt' # Issue #117
-    })
+if sys.platform == 'darwin':
     all_modifiers = {'alt', 'ctrl', 'shift', 'windows'}
-if platform.system() == 'Linux':
-    canonical_names.update({
-        "select": "end",
-        "find": "home",
-        'next': 'page down',
-        'prior': 'page up',
-    })
+
+# Results of `normalize_name`, which runs for every parsed key and event name.
+_normalized_names = {}
+_normalized_names_max = 4096
 
 def normalize_name(name):
     """
     Given a key name (e.g. "LEFT CONTROL"), clean up the string and convert to
     the canonical representation (e.g. "left ctrl") if one is known.
     """
+    try:
+        return _normalized_names[name]
+    except (KeyError, TypeError):
+        pass
+
     if not name or not isinstance(name, basestring):
         raise ValueError('Can only normalize non-empty string names. Unexpected '+ repr(name))
 
-    if len(name) > 1:
-        name = name.lower()
-    if name != '_' and '_' in name:
-        name = name.replace('_', ' ')
+    normalized = name
+    if len(normalized) > 1:
+        normalized = normalized.lower()
+    if normalized != '_' and '_' in normalized:
+        normalized = normalized.replace('_', ' ')
+    normalized = _get_canonical_names().get(normalized, normalized)
 
-    return canonical_names.get(name, name)
+    if len(_normalized_names) >= _normalized_names_max:
+        _normalized_names.clear()
+    _normalized_names[name] = normalized
+    return normalized
+
+_tables_changed_callbacks = []
+def on_tables_changed(callback):
+    """ Registers `callback` to be called by `tables_changed`. """
+    _tables_changed_callbacks.append(callback)
+
+def tables_changed():
+    """
+    Called by the backends after (re)building their key name tables, so
+    memoized name lookups are dropped.
+    """
+    _normalized_names.clear()
+    for callback in _tables_changed_callbacks:
+        callback()
@@ -443,6 +443,14 @@ def release(scan_code):
     """ Sends an 'up' event for the specified scan code """
     key_controller.release(scan_code)
 
+def send_events(events):
+    """ Sends a 'down' or 'up' event for each (scan_code, is_down) pair """
+    for scan_code, is_down in events:
+        if is_down:
+            key_controller.press(scan_code)
+        else:
+            key_controller.release(scan_code)
+
 def map_name(name):
     """ Returns a tuple of (scan_code, modifiers) where ``scan_code`` is a numeric scan code 
     and ``modifiers`` is an array of string modifier names (like 'shift') """
@@ -1,12 +1,65 @@
 # -*- coding: utf-8 -*-
-from threading import Thread, Lock
+from threading import Thread, Lock, Event, Condition
+from collections import deque
 import traceback
 import functools
 
-try:
-    from queue import Queue
-except ImportError:
-    from Queue import Queue
+class EventQueue(object):
+    """
+    Hands events from the OS listener thread to the processing thread. Any
+    number of threads may `put` (events also arrive from the thread calling
+    `direct_callback`, e.g. in tests); a single consumer drains everything
+    available at once with `get_batch`.
+
+    Keeps `put` and `join` from `queue.Queue`.
+    """
+    def __init__(self):
+        self.events = deque()
+        self.ready = Event()
+        # Counted on the consumer side, so `put` needs no lock: deque
+        # appends are atomic.
+        self.taken_count = 0
+        self.done_count = 0
+        self.done = Condition()
+
+    @property
+    def put_count(self):
+        # Length first: an event moved by `get_batch` in between is counted
+        # twice rather than missed, which only makes `join` wait for a
+        # `task_done` that is coming anyway.
+        return len(self.events) + self.taken_count
+
+    def put(self, event):
+        self.events.append(event)
+        if not self.ready.is_set():
+            self.ready.set()
+
+    def get_batch(self):
+        """ Blocks until events are available, then removes and returns all of them. """
+        self.ready.wait()
+        # Cleared before draining, so a `put` racing with us sets it again.
+        self.ready.clear()
+        batch = []
+        while self.events:
+            # Counted before the pop, so `put_count` never misses the event.
+            self.taken_count += 1
+            batch.append(self.events.popleft())
+        return batch
+
+    def task_done(self, count=1):
+        """ Marks `count` events from `get_batch` as processed, for `join`. """
+        with self.done:
+            self.done_count += count
+            self.done.notify_all()
+
+    def join(self):
+        """ Blocks until every event put so far has been processed. """
+        with self.done:
+            while self.done_count < self.put_count:
+                self.done.wait()
+
+    def __len__(self):
+        return len(self.events)
 
 class GenericListener(object):
     lock = Lock()
@@ -14,7 +67,7 @@ class GenericListener(object):
     def __init__(self):
         self.handlers = []
         self.listening = False
-        self.queue = Queue()
+        self.queue = EventQueue()
 
     def invoke_handlers(self, event):
         for handler in self.handlers:
@@ -54,10 +107,11 @@ class GenericListener(object):
         """
         assert self.queue is not None
         while True:
-            event = self.queue.get()
-            if self.pre_process_event(event):
-                self.invoke_handlers(event)
-            self.queue.task_done()
+            batch = self.queue.get_batch()
+            for event in batch:
+                if self.pre_process_event(event):
+                    self.invoke_handlers(event)
+            self.queue.task_done(len(batch))
             
     def add_handler(self, handler):
         """
@@ -1,8 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from time import time as now
-import json
-from ._canonical_names import canonical_names, normalize_name
+from ._canonical_names import normalize_name, all_modifiers
 
 try:
     basestring
@@ -12,29 +11,78 @@ except NameError:
 KEY_DOWN = 'down'
 KEY_UP = 'up'
 
+# Every known modifier gets one bit, in sorted order, so a mask converts back
+# to the same sorted tuple the backends report.
+modifier_names = tuple(sorted(all_modifiers))
+modifier_bits = dict((name, 1 << i) for i, name in enumerate(modifier_names))
+_modifiers_by_mask = {0: ()}
+
+def modifiers_to_mask(modifiers):
+    """ Returns the bitmask of the given modifier names. """
+    mask = 0
+    for name in modifiers:
+        mask |= modifier_bits.get(name, 0)
+    return mask
+
+def mask_to_modifiers(mask):
+    """ Returns the sorted tuple of modifier names in the given bitmask. """
+    try:
+        return _modifiers_by_mask[mask]
+    except KeyError:
+        modifiers = tuple(name for name in modifier_names if mask & modifier_bits[name])
+        _modifiers_by_mask[mask] = modifiers
+        return modifiers
+
 class KeyboardEvent(object):
-    event_type = None
-    scan_code = None
-    name = None
-    time = None
-    device = None
-    modifiers = None
-    is_keypad = None
-
-    def __init__(self, event_type, scan_code, name=None, time=None, device=None, modifiers=None, is_keypad=None):
+    # Slotted, since hooks and recordings create one of these per key event.
+    # `name` and `modifiers` are only resolved when first read.
+    __slots__ = ('event_type', 'scan_code', 'time', 'device', 'is_keypad', '_name', '_raw_name', '_modifiers', '_modifier_mask')
+
+    def __init__(self, event_type, scan_code, name=None, time=None, device=None, modifiers=None, is_keypad=None, modifier_mask=None):
         self.event_type = event_type
         self.scan_code = scan_code
         self.time = now() if time is None else time
         self.device = device
         self.is_keypad = is_keypad
-        self.modifiers = modifiers
-        if name:
-            self.name = normalize_name(name)
+        self._modifiers = modifiers
+        self._modifier_mask = modifier_mask
+        self._name = None
+        self._raw_name = name or None
+
+    @property
+    def name(self):
+        if self._raw_name is not None:
+            self._name = normalize_name(self._raw_name)
+            self._raw_name = None
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._raw_name = None
+        self._name = value
+
+    @property
+    def modifiers(self):
+        if self._modifiers is None and self._modifier_mask is not None:
+            self._modifiers = mask_to_modifiers(self._modifier_mask)
+        return self._modifiers
+
+    @modifiers.setter
+    def modifiers(self, value):
+        self._modifiers = value
+        self._modifier_mask = None
+
+    @property
+    def modifier_mask(self):
+        """ Bitmask of `modifiers` (see `modifier_bits`), or None if unknown. """
+        if self._modifier_mask is None and self._modifiers is not None:
+            self._modifier_mask = modifiers_to_mask(self._modifiers)
+        return self._modifier_mask
 
     def to_json(self, ensure_ascii=False):
+        import json
         attrs = dict(
             (attr, getattr(self, attr)) for attr in ['event_type', 'scan_code', 'name', 'time', 'device', 'is_keypad', 'modifiers']
-            if not attr.startswith('_')
         )
         return json.dumps(attrs, ensure_ascii=ensure_ascii)
 
@@ -14,8 +14,16 @@ and added to `output_events` immediately, mimicking real functionality.
 """
 from __future__ import print_function
 
+import os
+import shutil
+import sys
+import tempfile
 import unittest
 import time
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
 import keyboard
 from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP
@@ -66,6 +74,7 @@ keyboard._os_keyboard.listen = lambda callback: None
 keyboard._os_keyboard.map_name = dummy_keys.__getitem__
 keyboard._os_keyboard.press = lambda scan_code: send_instant_event(make_event(KEY_DOWN, None, scan_code))
 keyboard._os_keyboard.release = lambda scan_code: send_instant_event(make_event(KEY_UP, None, scan_code))
+keyboard._os_keyboard.send_events = lambda events: [keyboard._os_keyboard.press(scan_code) if is_down else keyboard._os_keyboard.release(scan_code) for scan_code, is_down in events]
 keyboard._os_keyboard.type_unicode = lambda char: output_events.append(KeyboardEvent(event_type=KEY_DOWN, scan_code=999, name=char))
 
 # Shortcuts for defining test inputs and expected outputs.
@@ -134,6 +143,162 @@ class TestKeyboard(unittest.TestCase):
         import json
         self.assertEqual(event, KeyboardEvent(**json.loads(event.to_json())))
 
+    def test_key_to_scan_codes_memoized(self):
+        calls = []
+        def map_name(name):
+            calls.append(name)
+            return dummy_keys[name]
+        keyboard._os_keyboard.map_name = map_name
+        try:
+            keyboard._canonical_names.tables_changed()
+            self.assertEqual(keyboard.key_to_scan_codes('a'), (1,))
+            self.assertEqual(keyboard.key_to_scan_codes('a'), (1,))
+            self.assertEqual(calls, ['a'])
+            keyboard._canonical_names.tables_changed()
+            self.assertEqual(keyboard.key_to_scan_codes('a'), (1,))
+            self.assertEqual(calls, ['a', 'a'])
+        finally:
+            keyboard._os_keyboard.map_name = dummy_keys.__getitem__
+            keyboard._canonical_names.tables_changed()
+
+    def test_key_to_scan_codes_failure_not_memoized(self):
+        failures = [ValueError('dumpkeys failed')]
+        def map_name(name):
+            if failures:
+                raise failures.pop()
+            return dummy_keys[name]
+        keyboard._os_keyboard.map_name = map_name
+        try:
+            keyboard._canonical_names.tables_changed()
+            with self.assertRaises(ValueError):
+                keyboard.key_to_scan_codes('a')
+            self.assertEqual(keyboard.key_to_scan_codes('a'), (1,))
+        finally:
+            keyboard._os_keyboard.map_name = dummy_keys.__getitem__
+            keyboard._canonical_names.tables_changed()
+
+    def test_key_to_scan_codes_memoized_missing(self):
+        with self.assertRaises(ValueError):
+            keyboard.key_to_scan_codes('unknown key')
+        with self.assertRaises(ValueError):
+            keyboard.key_to_scan_codes('unknown key')
+        self.assertEqual(keyboard.key_to_scan_codes('unknown key', False), ())
+
+    def test_pressed_scan_codes(self):
+        self.do(d_a+d_ctrl)
+        self.assertEqual(keyboard._pressed_events.scan_codes, frozenset([1, 7]))
+        self.do(u_a)
+        self.assertEqual(keyboard._pressed_events.scan_codes, frozenset([7]))
+        keyboard._pressed_events.clear()
+        self.assertEqual(keyboard._pressed_events.scan_codes, frozenset())
+
+    def test_subscribe(self):
+        with keyboard.subscribe() as events:
+            self.do(d_a+u_a)
+            self.assertEqual(events.get(timeout=0.5), d_a[0])
+            self.assertEqual(events.get_batch(timeout=0.5), u_a)
+            self.assertIsNone(events.get(timeout=0.01))
+        self.assertEqual(list(events), [])
+        self.assertEqual(keyboard._listener.handlers, [])
+
+    def test_subscribe_overflow(self):
+        with keyboard.subscribe(maxsize=2) as events:
+            self.do(du_a+du_b)
+            self.assertEqual(events.get_batch(), du_b)
+            self.assertEqual(events.dropped, 2)
+        with keyboard.subscribe(maxsize=2, overflow='drop_newest') as events:
+            self.do(du_a+du_b)
+            self.assertEqual(events.get_batch(max_events=1), d_a)
+            self.assertEqual(events.get_batch(), u_a)
+
+    def test_subscribe_iterate_until_closed(self):
+        events = keyboard.subscribe()
+        self.do(du_a)
+        events.close()
+        self.assertEqual(list(events), du_a)
+
+    def test_event_queue_batch(self):
+        from ._generic import EventQueue
+        queue = EventQueue()
+        queue.put(1)
+        queue.put(2)
+        self.assertEqual(queue.get_batch(), [1, 2])
+        queue.put(3)
+        self.assertEqual(queue.get_batch(), [3])
+        queue.task_done(3)
+        queue.join()
+
+    def test_event_queue_concurrent_put(self):
+        import threading
+        from ._generic import EventQueue
+        queue = EventQueue()
+        def produce():
+            for i in range(5000):
+                queue.put(i)
+        producers = [threading.Thread(target=produce) for _ in range(4)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        self.assertEqual(queue.put_count, 20000)
+        self.assertEqual(len(queue.get_batch()), 20000)
+        queue.task_done(20000)
+        queue.join()
+
+    def test_event_queue_join_waits_for_consumer(self):
+        import threading
+        from ._generic import EventQueue
+        queue = EventQueue()
+        processed = []
+        def consume():
+            while len(processed) < 3:
+                batch = queue.get_batch()
+                processed.extend(batch)
+                queue.task_done(len(batch))
+        consumer = threading.Thread(target=consume)
+        consumer.daemon = True
+        consumer.start()
+        for i in range(3):
+            queue.put(i)
+        queue.join()
+        self.assertEqual(processed, [0, 1, 2])
+        consumer.join(1)
+
+    def test_lazy_import(self):
+        # Importing must not load the OS backend nor build the names table.
+        import os, subprocess, sys
+        code = 'import keyboard, sys; from keyboard._canonical_names import canonical_names; print(" ".join(sorted(sys.modules)), keyboard._canonical_names._canonical_names is None)'
+        root = os.path.dirname(os.path.dirname(os.path.abspath(keyboard.__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root, universal_newlines=True).split()
+        self.assertEqual(output[-1], 'True')
+        for name in ('keyboard._winkeyboard', 'keyboard._nixkeyboard', 'keyboard._darwinkeyboard'):
+            self.assertNotIn(name, output)
+
+    def test_canonical_names_mapping(self):
+        from keyboard._canonical_names import canonical_names
+        self.assertEqual(canonical_names['escape'], 'esc')
+        self.assertIn('control', canonical_names)
+        self.assertEqual(dict(canonical_names), keyboard._canonical_names._get_canonical_names())
+        self.assertEqual(keyboard.normalize_name('Escape'), 'esc')
+        canonical_names['escape'] = 'escape'
+        try:
+            self.assertEqual(keyboard.normalize_name('Escape'), 'escape')
+        finally:
+            canonical_names['escape'] = 'esc'
+        self.assertEqual(keyboard.normalize_name('Escape'), 'esc')
+
+    def test_event_lazy_name(self):
+        event = KeyboardEvent(KEY_DOWN, 1, name='LEFT_CONTROL')
+        self.assertEqual(event.name, 'left ctrl')
+        self.assertIsNone(KeyboardEvent(KEY_DOWN, 1, name='').name)
+        self.assertFalse(hasattr(event, '__dict__'))
+
+    def test_event_modifier_mask(self):
+        event = KeyboardEvent(KEY_DOWN, 1, modifiers=('alt', 'shift'))
+        self.assertEqual(KeyboardEvent(KEY_DOWN, 1, modifier_mask=event.modifier_mask).modifiers, ('alt', 'shift'))
+        self.assertEqual(KeyboardEvent(KEY_DOWN, 1, modifier_mask=0).modifiers, ())
+        self.assertIsNone(KeyboardEvent(KEY_DOWN, 1).modifiers)
+
     def test_is_modifier_name(self):
         for name in keyboard.all_modifiers:
             self.assertTrue(keyboard.is_modifier(name))
@@ -266,6 +431,45 @@ class TestKeyboard(unittest.TestCase):
         keyboard.send('ctrl+shift+a', do_press=False, do_release=True)
         self.do([], u_a+u_shift+u_ctrl)
 
+    def test_send_cached(self):
+        keyboard.send('ctrl+a')
+        self.assertIn('ctrl+a', keyboard._compiled_hotkeys)
+        keyboard.send('ctrl+a')
+        self.do([], d_ctrl+d_a+u_a+u_ctrl+d_ctrl+d_a+u_a+u_ctrl)
+    def test_send_unhashable(self):
+        keyboard.send(['left ctrl', 'a'])
+        self.do([], d_ctrl+d_a+u_a+u_ctrl)
+    def test_send_single_batch(self):
+        batches = []
+        original = keyboard._os_keyboard.send_events
+        keyboard._os_keyboard.send_events = lambda events: batches.append(events) or original(events)
+        try:
+            keyboard.send('ctrl+shift+a')
+        finally:
+            keyboard._os_keyboard.send_events = original
+        self.assertEqual(len(batches), 1)
+        self.do([], d_ctrl+d_shift+d_a+u_a+u_shift+u_ctrl)
+    def test_send_scan_codes_press(self):
+        keyboard.send_scan_codes([7, 1], True)
+        self.do([], d_ctrl+d_a)
+    def test_send_scan_codes_release(self):
+        keyboard.send_scan_codes((1, 7), False)
+        self.do([], u_a+u_ctrl)
+
+    def test_listen_only_to(self):
+        calls = []
+        original = getattr(keyboard._os_keyboard, 'set_device_filter', None)
+        keyboard._os_keyboard.set_device_filter = lambda *args: calls.append(args)
+        try:
+            self.assertTrue(keyboard.listen_only_to(['ctrl+a', 'space'], grab=True))
+            self.assertTrue(keyboard.listen_only_to())
+        finally:
+            if original is None:
+                del keyboard._os_keyboard.set_device_filter
+            else:
+                keyboard._os_keyboard.set_device_filter = original
+        self.assertEqual(calls, [({0, 1, 7}, True), (None, False)])
+
     def test_call_later(self):
         triggered = []
         def fn(arg1, arg2):
@@ -767,6 +971,21 @@ class TestKeyboard(unittest.TestCase):
         keyboard.add_hotkey('a, b, c', trigger, suppress=True)
         self.do(du_a+du_b+du_a+du_b+du_space, du_a+du_b+du_a+du_b+du_space)
 
+    def test_add_hotkey_multistep_shared_prefix(self):
+        keyboard.add_hotkey('a, b', trigger, suppress=True)
+        other_event = KeyboardEvent(KEY_DOWN, scan_code=998)
+        keyboard.add_hotkey('a, c', lambda: output_events.append(other_event), suppress=True)
+        self.do(du_a)
+        self.assertEqual(len(keyboard._listener.blocking_hooks), 1)
+        self.do(du_c, [other_event])
+        self.do(du_a+du_b, triggered_event)
+    def test_add_hotkey_multistep_shared_prefix_remove(self):
+        remove = keyboard.add_hotkey('a, b', trigger, suppress=True)
+        keyboard.add_hotkey('a, c', trigger, suppress=True)
+        remove()
+        self.do(du_a+du_b, du_a+du_b)
+        self.do(du_a+du_c, triggered_event)
+
     def test_add_word_listener_success(self):
         queue = keyboard._queue.Queue()
         def free():
@@ -823,5 +1042,184 @@ class TestKeyboard(unittest.TestCase):
     #    self.do(du_a+du_b+du_c+du_space, [])
 
 
+@unittest.skipUnless(sys.platform.startswith('linux'), 'linux backend')
+class TestNixKeyboard(unittest.TestCase):
+    def setUp(self):
+        from . import _nixkeyboard
+        self.nix = _nixkeyboard
+        # Swap in empty tables, restored after the test.
+        saved = (dict(_nixkeyboard.to_name), dict(_nixkeyboard.from_name), set(_nixkeyboard.keypad_scan_codes), list(_nixkeyboard.name_by_state))
+        def restore():
+            for table, contents in zip((_nixkeyboard.to_name, _nixkeyboard.from_name, _nixkeyboard.keypad_scan_codes), saved):
+                table.clear()
+                table.update(contents)
+            _nixkeyboard.name_by_state[:] = saved[3]
+        self.addCleanup(restore)
+        for table in (_nixkeyboard.to_name, _nixkeyboard.from_name, _nixkeyboard.keypad_scan_codes):
+            table.clear()
+
+        cache_home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_home)
+        environ = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': cache_home})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def fill_tables(self):
+        self.nix.register_key((30, ()), 'a')
+        self.nix.register_key((30, ('shift',)), 'A')
+        self.nix.register_key((71, ()), 'keypad 7')
+        self.nix.register_key((71, ()), '7')
+        self.nix.keypad_scan_codes.add(71)
+
+    def tables(self):
+        return dict(self.nix.to_name), dict(self.nix.from_name), set(self.nix.keypad_scan_codes)
+
+    def clear_tables(self):
+        for table in (self.nix.to_name, self.nix.from_name, self.nix.keypad_scan_codes):
+            table.clear()
+
+    def test_tables_cache_round_trip(self):
+        self.fill_tables()
+        expected = self.tables()
+        self.nix.save_cached_tables()
+        self.assertTrue(os.path.isfile(self.nix.tables_cache_path()))
+        self.clear_tables()
+        self.assertTrue(self.nix.load_cached_tables())
+        self.assertEqual(self.tables(), expected)
+
+    def test_tables_cache_stale(self):
+        self.fill_tables()
+        self.nix.save_cached_tables()
+        self.clear_tables()
+        with mock.patch.object(self.nix, 'tables_cache_version', self.nix.tables_cache_version + 1):
+            self.assertFalse(self.nix.load_cached_tables())
+        with mock.patch.object(self.nix, 'keymap_fingerprint', lambda: 'other keymap'):
+            self.assertFalse(self.nix.load_cached_tables())
+        self.assertEqual(self.tables(), ({}, {}, set()))
+
+    def test_tables_cache_corrupt(self):
+        self.fill_tables()
+        self.nix.save_cached_tables()
+        self.clear_tables()
+        path = self.nix.tables_cache_path()
+        with open(path) as f:
+            contents = f.read()
+        for broken in (contents[:len(contents) // 2], 'not json', '[]', '{}'):
+            with open(path, 'w') as f:
+                f.write(broken)
+            self.assertFalse(self.nix.load_cached_tables())
+
+            # build_tables falls back to dumpkeys and rewrites the cache.
+            with mock.patch.object(self.nix, 'build_tables_from_dumpkeys', self.fill_tables):
+                self.nix.build_tables()
+            self.assertEqual(self.nix.to_name[(30, ())], ['a'])
+            self.clear_tables()
+            self.assertTrue(self.nix.load_cached_tables())
+            self.clear_tables()
+
+
+    def test_name_by_state_fallbacks(self):
+        self.fill_tables()
+        self.nix.register_key((30, ('alt gr', 'shift')), 'AltGrA')
+        self.nix.build_name_by_state()
+        name = lambda scan_code, *modifiers: self.nix.name_by_state[scan_code * self.nix.n_modifier_states + self.nix.modifier_state(modifiers)]
+        self.assertEqual(name(30), 'a')
+        self.assertEqual(name(30, 'shift'), 'A')
+        self.assertEqual(name(30, 'shift', 'alt gr'), 'AltGrA')
+        # No ctrl column: unmodified name.
+        self.assertEqual(name(30, 'ctrl'), 'a')
+        self.assertEqual(name(30, 'shift', 'ctrl'), 'a')
+        # No entry at all for this scan code.
+        self.assertEqual(name(31), 'unknown')
+        self.assertEqual(name(31, 'shift'), 'unknown')
+        self.assertEqual(len(self.nix.name_by_state), 72 * self.nix.n_modifier_states)
+
+    def test_name_by_state_matches_lookup(self):
+        # Same result as the `to_name` lookup the listener used to do.
+        self.fill_tables()
+        self.nix.build_name_by_state()
+        modifiers = ['shift', 'alt gr', 'ctrl', 'alt', 'windows']
+        for scan_code in (29, 30, 71):
+            for bits in range(1 << len(modifiers)):
+                pressed = [modifier for i, modifier in enumerate(modifiers) if bits & (1 << i)]
+                expected = (self.nix.to_name.get((scan_code, tuple(sorted(pressed)))) or self.nix.to_name.get((scan_code, ())) or ['unknown'])[0]
+                index = scan_code * self.nix.n_modifier_states + self.nix.modifier_state(pressed)
+                self.assertEqual(self.nix.name_by_state[index], expected)
+
+    def test_modifier_state(self):
+        self.assertEqual(self.nix.modifier_state([]), 0)
+        self.assertEqual(self.nix.modifier_state(['shift', 'alt gr']), 3)
+        self.assertEqual(self.nix.modifier_state(['ctrl', 'alt']), 12)
+        # Modifiers without a dumpkeys column select the unmodified names.
+        self.assertEqual(self.nix.modifier_state(['windows']), 0)
+        self.assertEqual(self.nix.modifier_state(['shift', 'windows']), 0)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'linux backend')
+class TestNixCommon(unittest.TestCase):
+    def fake_device(self, path):
+        """ EventDevice reading from a pipe instead of /dev/input. """
+        from ._nixcommon import EventDevice
+        read_fd, write_fd = os.pipe()
+        device = EventDevice(path)
+        device._input_file = os.fdopen(read_fd, 'rb', buffering=0)
+        writer = os.fdopen(write_fd, 'wb', buffering=0)
+        self.addCleanup(device._input_file.close)
+        self.addCleanup(writer.close)
+        return device, writer
+
+    def test_aggregate_grab_busy(self):
+        import errno, warnings
+        from . import _nixcommon
+        device, _ = self.fake_device('/dev/input/event90')
+        def grab():
+            raise IOError(errno.EBUSY, 'Device or resource busy')
+        device.grab = grab
+        device.mask_event_types = lambda types: True
+        with mock.patch.object(_nixcommon, 'make_uinput', side_effect=IOError('no uinput')), \
+             mock.patch.object(_nixcommon, 'list_devices_by_capability', lambda key_codes: [device]), \
+             warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            aggregated = _nixcommon.aggregate_devices('kbd', key_codes=[30], grab=True)
+        self.assertEqual(aggregated.devices, [device])
+        self.assertTrue(any('grab' in str(warning.message) for warning in caught))
+
+
+    def test_aggregated_read_events(self):
+        self.check_aggregated_read_events()
+
+    def test_aggregated_read_events_select_fallback(self):
+        from . import _nixcommon
+        with mock.patch.object(_nixcommon, 'DefaultSelector', _nixcommon.SelectSelector):
+            self.check_aggregated_read_events()
+
+    def check_aggregated_read_events(self):
+        from ._nixcommon import AggregatedEventDevice, EventDevice, event_struct, EV_KEY
+        first, first_writer = self.fake_device('/dev/input/event91')
+        second, second_writer = self.fake_device('/dev/input/event92')
+        missing = EventDevice('/nonexistent/event93')
+        aggregated = AggregatedEventDevice([missing, first, second], output=first)
+
+        first_writer.write(event_struct.pack(1, 0, EV_KEY, 30, 1) + event_struct.pack(1, 500000, EV_KEY, 30, 0))
+        second_writer.write(event_struct.pack(2, 0, EV_KEY, 31, 1))
+        events = []
+        while len(events) < 3:
+            events.extend(aggregated.read_events())
+        self.assertEqual(sorted(events), [
+            (1.0, EV_KEY, 30, 1, '/dev/input/event91'),
+            (1.5, EV_KEY, 30, 0, '/dev/input/event91'),
+            (2.0, EV_KEY, 31, 1, '/dev/input/event92'),
+        ])
+
+        # An unplugged device is dropped, the others keep working.
+        first_writer.close()
+        second_writer.write(event_struct.pack(3, 0, EV_KEY, 31, 0))
+        events = []
+        while not events:
+            events.extend(aggregated.read_events())
+        self.assertEqual(events, [(3.0, EV_KEY, 31, 0, '/dev/input/event92')])
+        self.assertEqual([key.data for key in aggregated.selector.get_map().values()], [second])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
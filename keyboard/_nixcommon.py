@@ -2,15 +2,47 @@
 import struct
 import os
 import atexit
+import select
 from time import time as now
-from threading import Thread
+from collections import deque, namedtuple
 from glob import glob
+
+EVENT_READ = 1
+SelectorKey = namedtuple('SelectorKey', 'fileobj fd events data')
+
+class SelectSelector(object):
+    """ The subset of selectors.DefaultSelector used here, for Python 2. """
+    def __init__(self):
+        self.keys = {}
+
+    def register(self, fileobj, events, data=None):
+        key = SelectorKey(fileobj, fileobj.fileno(), events, data)
+        if key.fd in self.keys:
+            raise KeyError('{!r} is already registered'.format(fileobj))
+        self.keys[key.fd] = key
+        return key
+
+    def unregister(self, fileobj):
+        for fd, key in list(self.keys.items()):
+            if key.fileobj is fileobj:
+                return self.keys.pop(fd)
+        raise KeyError('{!r} is not registered'.format(fileobj))
+
+    def select(self, timeout=None):
+        ready, _, _ = select.select(list(self.keys), [], [], timeout)
+        return [(self.keys[fd], EVENT_READ) for fd in ready]
+
+    def get_map(self):
+        return self.keys
+
 try:
-    from queue import Queue
+    from selectors import DefaultSelector, EVENT_READ
 except ImportError:
-    from Queue import Queue
+    # Python 2
+    DefaultSelector = SelectSelector
 
 event_bin_format = 'llHHI'
+event_struct = struct.Struct(event_bin_format)
 
 # Taken from include/linux/input.h
 # https://www.kernel.org/doc/Documentation/input/event-codes.txt
@@ -19,6 +51,30 @@ EV_KEY = 0x01
 EV_REL = 0x02
 EV_ABS = 0x03
 EV_MSC = 0x04
+EV_MAX = 0x1f
+KEY_MAX = 0x2ff
+
+# ioctl requests from include/uapi/linux/input.h.
+EVIOCGRAB = 0x40044590
+EVIOCSMASK = 0x40104593
+def EVIOCGNAME(length):
+    # _IOC(_IOC_READ, 'E', 0x06, length)
+    return (2 << 30) | (length << 16) | (ord('E') << 8) | 0x06
+def EVIOCGBIT(type, length):
+    # _IOC(_IOC_READ, 'E', 0x20 + type, length)
+    return (2 << 30) | (length << 16) | (ord('E') << 8) | (0x20 + type)
+
+def query_bits(fd, type, max_code):
+    """
+    Returns the set of codes the device behind `fd` reports for event `type`
+    (or the set of supported event types, if `type` is 0).
+    """
+    import fcntl
+    buffer = bytearray((max_code + 8) // 8)
+    fcntl.ioctl(fd, EVIOCGBIT(type, len(buffer)), buffer)
+    return set(code for code in range(max_code + 1) if buffer[code >> 3] & (1 << (code & 7)))
+
+uinput_name = 'Virtual Keyboard'
 
 def make_uinput():
     if not os.path.exists('/dev/uinput'):
@@ -38,7 +94,7 @@ def make_uinput():
     BUS_USB = 0x03
     uinput_user_dev = "80sHHHHi64i64i64i64i"
     axis = [0] * 64 * 4
-    uinput.write(struct.pack(uinput_user_dev, b"Virtual Keyboard", BUS_USB, 1, 1, 1, 0, *axis))
+    uinput.write(struct.pack(uinput_user_dev, uinput_name.encode(), BUS_USB, 1, 1, 1, 0, *axis))
     uinput.flush() # Without this you may get Errno 22: Invalid argument.
 
     UI_DEV_CREATE = 0x5501
@@ -48,17 +104,24 @@ def make_uinput():
 
     return uinput
 
+# Maximum number of events returned by a single `read_events` call.
+read_batch_size = 64
+
 class EventDevice(object):
     def __init__(self, path):
         self.path = path
         self._input_file = None
         self._output_file = None
+        self._read_buffer = bytearray(event_struct.size * read_batch_size)
+        self._read_view = memoryview(self._read_buffer)
 
     @property
     def input_file(self):
         if self._input_file is None:
             try:
-                self._input_file = open(self.path, 'rb')
+                # Unbuffered, so readiness reported by select matches what
+                # is left to read.
+                self._input_file = open(self.path, 'rb', buffering=0)
             except IOError as e:
                 if e.strerror == 'Permission denied':
                     print("# ERROR: Failed to read device '{}'. You must be in the 'input' group to access global events. Use 'sudo usermod -a -G input USERNAME' to add user to the required group.".format(self.path))
@@ -79,42 +142,161 @@ class EventDevice(object):
             atexit.register(self._output_file.close)
         return self._output_file
 
+    def name(self):
+        """ Returns the device name as reported by the kernel. """
+        import fcntl
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            buffer = bytearray(256)
+            fcntl.ioctl(fd, EVIOCGNAME(len(buffer)), buffer)
+            return buffer.split(b'\0', 1)[0].decode('utf-8', 'replace')
+        finally:
+            os.close(fd)
+
+    def supported_keys(self):
+        """
+        Returns the set of key codes this device can emit, as reported by the
+        kernel. Does not require the device to be opened through `input_file`.
+        """
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            if EV_KEY not in query_bits(fd, 0, EV_MAX):
+                return set()
+            return query_bits(fd, EV_KEY, KEY_MAX)
+        finally:
+            os.close(fd)
+
+    def grab(self):
+        """
+        Takes exclusive access of the device, so its events are delivered to
+        this process only. Released automatically when the file is closed.
+        """
+        import fcntl
+        fcntl.ioctl(self.input_file, EVIOCGRAB, 1)
+
+    def mask_event_types(self, types):
+        """
+        Asks the kernel to deliver only events of the given types (plus
+        syncs) to this reader. Returns False if the kernel doesn't support
+        event masks (before Linux 4.4).
+        """
+        import fcntl, ctypes
+        mask = bytearray((EV_MAX + 8) // 8)
+        for type in types:
+            mask[type >> 3] |= 1 << (type & 7)
+        codes = (ctypes.c_char * len(mask)).from_buffer(mask)
+        # struct input_mask { __u32 type; __u32 codes_size; __u64 codes_ptr; }
+        # where the EV_SYN mask selects whole event types.
+        request = struct.pack('IIQ', EV_SYN, len(mask), ctypes.addressof(codes))
+        try:
+            fcntl.ioctl(self.input_file, EVIOCSMASK, request)
+        except (OSError, IOError):
+            return False
+        return True
+
     def read_event(self):
-        data = self.input_file.read(struct.calcsize(event_bin_format))
-        seconds, microseconds, type, code, value = struct.unpack(event_bin_format, data)
+        data = self.input_file.read(event_struct.size)
+        seconds, microseconds, type, code, value = event_struct.unpack(data)
         return seconds + microseconds / 1e6, type, code, value, self.path
 
+    def read_events(self):
+        """
+        Blocks until events are available, then returns all of them (up to
+        `read_batch_size`) from a single read, in the same format as
+        `read_event`.
+        """
+        size = self.input_file.readinto(self._read_buffer)
+        if not size:
+            raise EOFError('Device {} closed.'.format(self.path))
+        path = self.path
+        return [
+            (seconds + microseconds / 1e6, type, code, value, path)
+            for seconds, microseconds, type, code, value
+            in event_struct.iter_unpack(self._read_view[:size - size % event_struct.size])
+        ]
+
     def write_event(self, type, code, value):
+        self.write_events([(type, code, value)])
+
+    def write_events(self, events):
+        """
+        Writes all `(type, code, value)` events with a single `write` call,
+        followed by one sync event so other programs see them together. A sync
+        is also inserted before a key repeats inside the batch (e.g. press and
+        release of the same key), so each report holds one state per key.
+        """
         integer, fraction = divmod(now(), 1)
         seconds = int(integer)
         microseconds = int(fraction * 1e6)
-        data_event = struct.pack(event_bin_format, seconds, microseconds, type, code, value)
+
+        size = event_struct.size
+        data = bytearray(size * (2 * len(events) + 1))
+        offset = 0
+        in_report = set()
+        for type, code, value in events:
+            if (type, code) in in_report:
+                event_struct.pack_into(data, offset, seconds, microseconds, EV_SYN, 0, 0)
+                offset += size
+                in_report.clear()
+            in_report.add((type, code))
+            event_struct.pack_into(data, offset, seconds, microseconds, type, code, value)
+            offset += size
 
         # Send a sync event to ensure other programs update.
-        sync_event = struct.pack(event_bin_format, seconds, microseconds, EV_SYN, 0, 0)
+        event_struct.pack_into(data, offset, seconds, microseconds, EV_SYN, 0, 0)
+        offset += size
 
-        self.output_file.write(data_event + sync_event)
         self.output_file.flush()
+        os.write(self.output_file.fileno(), memoryview(data)[:offset])
 
 class AggregatedEventDevice(object):
     def __init__(self, devices, output=None):
-        self.event_queue = Queue()
         self.devices = devices
         self.output = output or self.devices[0]
-        def start_reading(device):
-            while True:
-                self.event_queue.put(device.read_event())
+        # All devices are multiplexed on the thread calling `read_event`,
+        # instead of one reader thread per device.
+        self.pending = deque()
+        self.selector = DefaultSelector()
         for device in self.devices:
-            thread = Thread(target=start_reading, args=[device])
-            thread.daemon = True
-            thread.start()
+            try:
+                input_file = device.input_file
+                if input_file is not None:
+                    self.selector.register(input_file, EVENT_READ, device)
+            except (OSError, IOError, ValueError, KeyError):
+                # Unplugged between listing and opening; keep reading the rest.
+                pass
 
     def read_event(self):
-        return self.event_queue.get(block=True)
+        while not self.pending:
+            self.pending.extend(self.read_events())
+        return self.pending.popleft()
+
+    def read_events(self):
+        """
+        Blocks until any device has events, then returns all events read
+        from the ready devices.
+        """
+        if self.pending:
+            events = list(self.pending)
+            self.pending.clear()
+            return events
+
+        events = []
+        while not events:
+            for key, _ in self.selector.select():
+                try:
+                    events.extend(key.data.read_events())
+                except (OSError, IOError, EOFError):
+                    # Device was unplugged.
+                    self.selector.unregister(key.fileobj)
+        return events
 
     def write_event(self, type, code, value):
         self.output.write_event(type, code, value)
 
+    def write_events(self, events):
+        self.output.write_events(events)
+
 import re
 from collections import namedtuple
 DeviceDescription = namedtuple('DeviceDescription', 'event_file is_mouse is_keyboard')
@@ -136,7 +318,30 @@ def list_devices_from_by_id(name_suffix, by_id=True):
     for path in glob('/dev/input/{}/*-event-{}'.format('by-id' if by_id else 'by-path', name_suffix)):
         yield EventDevice(path)
 
-def aggregate_devices(type_name):
+def list_devices_by_capability(key_codes):
+    """
+    Yields the devices that can emit at least one of the given key codes,
+    queried directly from the kernel.
+    """
+    key_codes = set(key_codes)
+    for path in sorted(glob('/dev/input/event*')):
+        device = EventDevice(path)
+        try:
+            # Skip our own uinput device, or injected keys would be read back.
+            if device.supported_keys() & key_codes and device.name() != uinput_name:
+                yield device
+        except (OSError, IOError):
+            # No permission, or not an evdev device.
+            pass
+
+def aggregate_devices(type_name, key_codes=None, grab=False, event_types=None):
+    """
+    Returns a device reading from all devices of the given type. If
+    `key_codes` is given, only devices that can emit one of those keys are
+    read, falling back to the type lookup if none are found. If `grab` is
+    true the read devices are taken exclusively, and if `event_types` is given
+    the kernel is asked to drop events of any other type.
+    """
     # Some systems have multiple keyboards with different range of allowed keys
     # on each one, like a notebook with a "keyboard" device exclusive for the
     # power button. Instead of figuring out which keyboard allows which key to
@@ -154,15 +359,33 @@ def aggregate_devices(type_name):
     # We don't aggregate devices from different sources to avoid
     # duplicates.
 
-    devices_from_proc = list(list_devices_from_proc(type_name))
-    if devices_from_proc:
-        return AggregatedEventDevice(devices_from_proc, output=fake_device)
+    devices = []
+    if key_codes is not None:
+        devices = list(list_devices_by_capability(key_codes))
+
+    if not devices:
+        devices = list(list_devices_from_proc(type_name))
 
-    # breaks on mouse for virtualbox
-    # was getting /dev/input/by-id/usb-VirtualBox_USB_Tablet-event-mouse
-    devices_from_by_id = list(list_devices_from_by_id(type_name)) or list(list_devices_from_by_id(type_name, by_id=False))
-    if devices_from_by_id:
-        return AggregatedEventDevice(devices_from_by_id, output=fake_device)
+    if not devices:
+        # breaks on mouse for virtualbox
+        # was getting /dev/input/by-id/usb-VirtualBox_USB_Tablet-event-mouse
+        devices = list(list_devices_from_by_id(type_name)) or list(list_devices_from_by_id(type_name, by_id=False))
+
+    # Devices that failed to open (e.g. unplugged since listed) are skipped.
+    devices = [device for device in devices if device.input_file is not None]
+
+    if devices:
+        for device in devices:
+            if grab:
+                try:
+                    device.grab()
+                except (OSError, IOError) as e:
+                    # E.g. EBUSY if another program already grabbed it.
+                    import warnings
+                    warnings.warn('Failed to grab device {}, reading it without exclusive access: {}'.format(device.path, e), stacklevel=2)
+            if event_types is not None:
+                device.mask_event_types(event_types)
+        return AggregatedEventDevice(devices, output=fake_device)
 
     # If no keyboards were found we can only use the fake device to send keys.
     assert fake_device
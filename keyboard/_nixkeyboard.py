@@ -3,8 +3,8 @@ import struct
 import traceback
 from time import time as now
 from collections import namedtuple
-from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP
-from ._canonical_names import all_modifiers, normalize_name
+from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP, modifiers_to_mask
+from ._canonical_names import all_modifiers, normalize_name, tables_changed
 from ._nixcommon import EV_KEY, aggregate_devices
 
 # TODO: start by reading current keyboard state, as to not missing any already pressed keys.
@@ -53,6 +53,18 @@ to_name = defaultdict(list)
 from_name = defaultdict(list)
 keypad_scan_codes = set()
 
+# Modifiers that select a dumpkeys column, as bits of the column number.
+modifier_state_bits = {
+    'shift': 1,
+    'alt gr': 2,
+    'ctrl': 4,
+    'alt': 8,
+}
+n_modifier_states = 16
+# Dense copy of `to_name` for the listener: the name of scan code `s` with
+# modifier state `m` is at `name_by_state[s * n_modifier_states + m]`.
+name_by_state = []
+
 def register_key(key_and_modifiers, name):
     if name not in to_name[key_and_modifiers]:
         to_name[key_and_modifiers].append(name)
@@ -62,12 +74,13 @@ def register_key(key_and_modifiers, name):
 def build_tables():
     if to_name and from_name: return
 
-    modifiers_bits = {
-        'shift': 1,
-        'alt gr': 2,
-        'ctrl': 4,
-        'alt': 8,
-    }
+    if not load_cached_tables():
+        build_tables_from_dumpkeys()
+        save_cached_tables()
+    build_name_by_state()
+    tables_changed()
+
+def build_tables_from_dumpkeys():
     keycode_template = r'^keycode\s+(\d+)\s+=(.*?)$'
     try:
         dump = check_output(['dumpkeys', '--keys-only'], universal_newlines=True)
@@ -81,7 +94,7 @@ def build_tables():
     for str_scan_code, str_names in re.findall(keycode_template, dump, re.MULTILINE):
         scan_code = int(str_scan_code)
         for i, str_name in enumerate(str_names.strip().split()):
-            modifiers = tuple(sorted(modifier for modifier, bit in modifiers_bits.items() if i & bit))
+            modifiers = tuple(sorted(modifier for modifier, bit in modifier_state_bits.items() if i & bit))
             name, is_keypad = cleanup_key(str_name)
             register_key((scan_code, modifiers), name)
             if is_keypad:
@@ -115,11 +128,114 @@ def build_tables():
             from_name[original].extend(from_name[synonym])
             from_name[synonym].extend(from_name[original])
 
+"""
+Parsing dumpkeys is slow and needs the "tty" group, so the resulting tables
+are cached as JSON in $XDG_CACHE_HOME. The cache is keyed by a fingerprint of
+the console keymap configuration; delete the file to force a rebuild after
+changing the keymap by other means (e.g. `loadkeys`).
+"""
+import os
+import json
+import hashlib
+
+tables_cache_version = 1
+keymap_config_files = ['/etc/vconsole.conf', '/etc/default/keyboard', '/etc/conf.d/keymaps', '/etc/sysconfig/keyboard']
+
+def tables_cache_path():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'keyboard', 'dumpkeys-tables.json')
+
+def keymap_fingerprint():
+    digest = hashlib.sha1()
+    for path in keymap_config_files:
+        digest.update(path.encode('utf-8') + b'\0')
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except (IOError, OSError):
+            digest.update(b'-')
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def load_cached_tables():
+    """ Fills the tables from the cache file. Returns False if it's missing or stale. """
+    try:
+        with open(tables_cache_path()) as f:
+            cache = json.load(f)
+        if cache['version'] != tables_cache_version or cache['fingerprint'] != keymap_fingerprint():
+            return False
+        loaded_to_name = [((scan_code, tuple(modifiers)), names) for scan_code, modifiers, names in cache['to_name']]
+        loaded_from_name = [(name, [(scan_code, tuple(modifiers)) for scan_code, modifiers in entries]) for name, entries in cache['from_name'].items()]
+        loaded_keypad_scan_codes = cache['keypad_scan_codes']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return False
+
+    to_name.update(loaded_to_name)
+    from_name.update(loaded_from_name)
+    keypad_scan_codes.update(loaded_keypad_scan_codes)
+    return True
+
+def save_cached_tables():
+    """ Writes the tables to the cache file, ignoring failures. """
+    cache = {
+        'version': tables_cache_version,
+        'fingerprint': keymap_fingerprint(),
+        'to_name': [[scan_code, modifiers, names] for (scan_code, modifiers), names in to_name.items() if names],
+        'from_name': dict((name, entries) for name, entries in from_name.items() if entries),
+        'keypad_scan_codes': sorted(keypad_scan_codes),
+    }
+    path = tables_cache_path()
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # Write then rename, so a concurrent reader never sees half a file.
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(temp_path, path)
+    except (IOError, OSError):
+        pass
+
+def build_name_by_state():
+    """ Flattens `to_name` into `name_by_state`, with the same fallbacks as a lookup. """
+    states = [tuple(sorted(modifier for modifier, bit in modifier_state_bits.items() if state & bit)) for state in range(n_modifier_states)]
+    n_scan_codes = max(scan_code for scan_code, _ in to_name) + 1 if to_name else 0
+    table = []
+    for scan_code in range(n_scan_codes):
+        default = to_name.get((scan_code, ())) or ['unknown']
+        for modifiers in states:
+            table.append((to_name.get((scan_code, modifiers)) or default)[0])
+    name_by_state[:] = table
+
+def modifier_state(modifiers):
+    """
+    Returns the dumpkeys column for the pressed modifiers, or 0 if any of them
+    has no column (e.g. windows), like a failed lookup of the modifiers tuple.
+    """
+    state = 0
+    for modifier in modifiers:
+        if modifier not in modifier_state_bits:
+            return 0
+        state |= modifier_state_bits[modifier]
+    return state
+
 device = None
+device_key_codes = None
+grab_devices = False
 def build_device():
     global device
     if device: return
-    device = aggregate_devices('kbd')
+    device = aggregate_devices('kbd', key_codes=device_key_codes, grab=grab_devices, event_types=[EV_KEY])
+
+def set_device_filter(scan_codes=None, grab=False):
+    """
+    Restricts listening to devices that can emit one of `scan_codes` (all
+    keyboards if None), optionally grabbing them. Only takes effect if called
+    before the device is first used.
+    """
+    global device_key_codes, grab_devices
+    device_key_codes = None if scan_codes is None else set(scan_codes)
+    grab_devices = grab
 
 def init():
     build_device()
@@ -131,26 +247,33 @@ def listen(callback):
     build_device()
     build_tables()
 
+    # Only rebuilt when a modifier changes, not for every event.
+    state = modifier_state(pressed_modifiers)
+    pressed_modifiers_mask = modifiers_to_mask(pressed_modifiers)
+    table_size = len(name_by_state)
+
     while True:
-        time, type, code, value, device_id = device.read_event()
-        if type != EV_KEY:
-            continue
-
-        scan_code = code
-        event_type = KEY_DOWN if value else KEY_UP # 0 = UP, 1 = DOWN, 2 = HOLD
-
-        pressed_modifiers_tuple = tuple(sorted(pressed_modifiers))
-        names = to_name[(scan_code, pressed_modifiers_tuple)] or to_name[(scan_code, ())] or ['unknown']
-        name = names[0]
-            
-        if name in all_modifiers:
-            if event_type == KEY_DOWN:
-                pressed_modifiers.add(name)
-            else:
-                pressed_modifiers.discard(name)
-
-        is_keypad = scan_code in keypad_scan_codes
-        callback(KeyboardEvent(event_type=event_type, scan_code=scan_code, name=name, time=time, device=device_id, is_keypad=is_keypad, modifiers=pressed_modifiers_tuple))
+        for time, type, code, value, device_id in device.read_events():
+            if type != EV_KEY:
+                continue
+
+            scan_code = code
+            event_type = KEY_DOWN if value else KEY_UP # 0 = UP, 1 = DOWN, 2 = HOLD
+
+            index = scan_code * n_modifier_states + state
+            name = name_by_state[index] if index < table_size else 'unknown'
+
+            event = KeyboardEvent(event_type=event_type, scan_code=scan_code, name=name, time=time, device=device_id, is_keypad=scan_code in keypad_scan_codes, modifier_mask=pressed_modifiers_mask)
+
+            if name in all_modifiers:
+                if event_type == KEY_DOWN:
+                    pressed_modifiers.add(name)
+                else:
+                    pressed_modifiers.discard(name)
+                state = modifier_state(pressed_modifiers)
+                pressed_modifiers_mask = modifiers_to_mask(pressed_modifiers)
+
+            callback(event)
 
 def write_event(scan_code, is_down):
     build_device()
@@ -172,6 +295,11 @@ def press(scan_code):
 def release(scan_code):
     write_event(scan_code, False)
 
+def send_events(events):
+    """ Sends all `(scan_code, is_down)` pairs in a single device write. """
+    build_device()
+    device.write_events([(EV_KEY, scan_code, int(is_down)) for scan_code, is_down in events])
+
 def type_unicode(character):
     codepoint = ord(character)
     hexadecimal = hex(codepoint)[len('0x'):]
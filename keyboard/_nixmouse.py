@@ -75,29 +75,29 @@ def listen(queue):
     build_device()
 
     while True:
-        time, type, code, value, device_id = device.read_event()
-        if type == EV_SYN or type == EV_MSC:
-            continue
+        for time, type, code, value, device_id in device.read_events():
+            if type == EV_SYN or type == EV_MSC:
+                continue
 
-        event = None
-        arg = None
+            event = None
+            arg = None
 
-        if type == EV_KEY:
-            event = ButtonEvent(DOWN if value else UP, button_by_code.get(code, '?'), time)
-        elif type == EV_REL:
-            value, = struct.unpack('i', struct.pack('I', value))
+            if type == EV_KEY:
+                event = ButtonEvent(DOWN if value else UP, button_by_code.get(code, '?'), time)
+            elif type == EV_REL:
+                value, = struct.unpack('i', struct.pack('I', value))
 
-            if code == REL_WHEEL:
-                event = WheelEvent(value, time)
-            elif code in (REL_X, REL_Y):
-                x, y = get_position()
-                event = MoveEvent(x, y, time)
+                if code == REL_WHEEL:
+                    event = WheelEvent(value, time)
+                elif code in (REL_X, REL_Y):
+                    x, y = get_position()
+                    event = MoveEvent(x, y, time)
 
-        if event is None:
-            # Unknown event type.
-            continue
+            if event is None:
+                # Unknown event type.
+                continue
 
-        queue.put(event)
+            queue.put(event)
 
 def press(button=LEFT):
     build_device()
@@ -114,8 +114,7 @@ def move_relative(x, y):
         x += 2**32
     if y < 0:
         y += 2**32
-    device.write_event(EV_REL, REL_X, x)
-    device.write_event(EV_REL, REL_Y, y)
+    device.write_events([(EV_REL, REL_X, x), (EV_REL, REL_Y, y)])
 
 def wheel(delta=1):
     build_device()
@@ -18,7 +18,7 @@ from threading import Lock
 from collections import defaultdict
 
 from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP
-from ._canonical_names import normalize_name
+from ._canonical_names import normalize_name, tables_changed
 try:
     # Force Python2 to convert to unicode and not to str.
     chr = unichr
@@ -426,14 +426,18 @@ def _setup_name_tables():
                 to_name[(541, 162, extended, modifiers)] = ['alt gr']
                 from_name['alt gr'].append((1, (541, 162, extended, modifiers)))
 
-    modifiers_preference = defaultdict(lambda: 10)
-    modifiers_preference.update({(): 0, ('shift',): 1, ('alt gr',): 2, ('ctrl',): 3, ('alt',): 4})
-    def order_key(line):
-        i, entry = line
-        scan_code, vk, extended, modifiers = entry
-        return modifiers_preference[modifiers], i, extended, vk, scan_code
-    for name, entries in list(from_name.items()):
-        from_name[name] = sorted(set(entries), key=order_key)
+        # Sorted while still holding the lock, so a concurrent caller that
+        # returns early never sees unordered entries.
+        modifiers_preference = defaultdict(lambda: 10)
+        modifiers_preference.update({(): 0, ('shift',): 1, ('alt gr',): 2, ('ctrl',): 3, ('alt',): 4})
+        def order_key(line):
+            i, entry = line
+            scan_code, vk, extended, modifiers = entry
+            return modifiers_preference[modifiers], i, extended, vk, scan_code
+        for name, entries in list(from_name.items()):
+            from_name[name] = sorted(set(entries), key=order_key)
+
+    tables_changed()
 
 # Called by keyboard/__init__.py
 init = _setup_name_tables
@@ -593,6 +597,10 @@ def press(code):
 def release(code):
     _send_event(code, 2)
 
+def send_events(events):
+    for code, is_down in events:
+        _send_event(code, 0 if is_down else 2)
+
 def type_unicode(character):
     # This code and related structures are based on
     # http://stackoverflow.com/a/11910555/252218
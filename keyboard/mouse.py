@@ -5,15 +5,15 @@ warnings.warn('The mouse sub-library is deprecated and will be removed in future
 
 import time as _time
 
-import platform as _platform
-if _platform.system() == 'Windows':
+import sys as _sys
+if _sys.platform == 'win32':
     from. import _winmouse as _os_mouse
-elif _platform.system() == 'Linux':
+elif _sys.platform.startswith('linux'):
     from. import _nixmouse as _os_mouse
-elif _platform.system() == 'Darwin':
+elif _sys.platform == 'darwin':
     from. import _darwinmouse as _os_mouse
 else:
-    raise OSError("Unsupported platform '{}'".format(_platform.system()))
+    raise OSError("Unsupported platform '{}'".format(_sys.platform))
 
 from ._mouse_event import ButtonEvent, MoveEvent, WheelEvent, LEFT, RIGHT, MIDDLE, X, X2, UP, DOWN, DOUBLE
 from ._generic import GenericListener as _GenericListener